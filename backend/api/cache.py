@@ -0,0 +1,129 @@
+from functools import wraps
+from hashlib import md5
+from time import time_ns
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+GENERATION_KEY = 'generation:{}'
+RECIPE_FRAGMENTS = 'recipe-fragments'
+RECIPE_RESPONSES = 'recipe-responses'
+RECIPE_VERSION_KEY = 'recipe-version:{}'
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping-cart'
+SUBSCRIPTIONS = 'subscriptions'
+
+
+def get_generation(name):
+    """Возвращает текущее поколение набора данных.
+
+    Поколение входит в ключи кэша, поэтому его смена делает недоступными
+    все записи, построенные по устаревшим данным. Начальное значение
+    берётся из времени, чтобы после вытеснения ключа не повторить старое.
+    """
+    key = GENERATION_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(*names):
+    """Сбрасывает поколения, записывая новые значения по времени.
+
+    cache.incr не подходит: в части бэкендов он перезаписывает ключ со
+    сроком жизни по умолчанию, и поколение пропадает через TIMEOUT.
+    """
+    generation = time_ns()
+    cache.set_many(
+        {GENERATION_KEY.format(name): generation for name in names}, None
+    )
+
+
+def user_generation(name, user_id):
+    """Имя поколения данных одного пользователя: избранного, корзины."""
+    return f'{name}:{user_id}'
+
+
+def get_recipe_versions(pks):
+    """Возвращает версии рецептов, входящие в ключи их фрагментов.
+
+    Запись удаляет версию рецепта, и следующее чтение выдаёт новую по
+    времени. Фрагмент, отрисованный по старым данным, остаётся под
+    старым ключом и больше не читается.
+    """
+    keys = {pk: RECIPE_VERSION_KEY.format(pk) for pk in pks}
+    versions = cache.get_many(keys.values())
+    missing = {key: time_ns() for key in keys.values() if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {pk: versions[key] for pk, key in keys.items()}
+
+
+def recipe_fragment_keys(pks):
+    generation = get_generation(RECIPE_FRAGMENTS)
+    return {
+        pk: f'recipe-fragment:{generation}:{pk}:{version}'
+        for pk, version in get_recipe_versions(pks).items()
+    }
+
+
+def invalidate_recipe_fragments(pks):
+    cache.delete_many([RECIPE_VERSION_KEY.format(pk) for pk in pks])
+
+
+def generation_etag(name):
+    """Строит функцию ETag для django.views.decorators.http.condition."""
+
+    def etag(request, *args, **kwargs):
+        return md5(
+            f'{name}:{get_generation(name)}:{request.get_full_path()}'.encode(
+                'utf-8'
+            )
+        ).hexdigest()
+
+    return etag
+
+
+def anonymous_response_cache(generation_name, query_params):
+    """Кэширует ответы действия вьюсета для анонимных пользователей.
+
+    Ключ включает адрес запроса, отсортированные значения query_params
+    и поколение generation_name: после любой записи, сбрасывающей
+    поколение, следующий запрос строит ответ заново.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+            params = urlencode(
+                [
+                    (param, sorted(request.query_params.getlist(param)))
+                    for param in query_params
+                ],
+                doseq=True,
+            )
+            key = 'response:{}:{}'.format(
+                get_generation(generation_name),
+                md5(
+                    request.build_absolute_uri(f'{request.path}?{params}')
+                    .encode('utf-8')
+                ).hexdigest(),
+            )
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -2,3 +2,6 @@ MIN_AMOUNT = 1
 MAX_AMOUNT = 32_000
 MIN_TIME = 1
 MAX_TIME = 32_000
+INGREDIENT_SEARCH_LIMIT = 50
+SHOPPING_LIST_CHUNK_SIZE = 2000
+BATCH_RECIPES_LIMIT = 500
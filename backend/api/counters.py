@@ -0,0 +1,7 @@
+from django.db.models import F
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарно изменяет счётчик field у объектов model на delta."""
+    if delta:
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
@@ -0,0 +1,67 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+
+class HybridImageField(Base64ImageField):
+    """Изображение строкой base64 или файлом из multipart-запроса.
+
+    Формат и размеры проверяются по заголовку файла до полного
+    декодирования, а слишком длинные строки base64 не декодируются вовсе.
+    """
+
+    ALLOWED_FORMATS = {
+        'JPEG': 'jpg',
+        'PNG': 'png',
+        'GIF': 'gif',
+        'WEBP': 'webp',
+    }
+    ALLOWED_TYPES = tuple(ALLOWED_FORMATS.values()) + ('jpeg',)
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            if data.size > settings.UPLOAD_MAX_SIZE:
+                raise self.too_large()
+            image_format = self.check_header(data)
+            data.name = f'{uuid4()}.{self.ALLOWED_FORMATS[image_format]}'
+            return serializers.ImageField.to_internal_value(self, data)
+        if isinstance(data, str) and len(data) > self.max_base64_length():
+            raise self.too_large()
+        file = super().to_internal_value(data)
+        if file is not None:
+            self.check_header(file)
+        return file
+
+    @staticmethod
+    def max_base64_length():
+        # Заголовок data:image/...;base64, и округление до четвёрок.
+        return (settings.UPLOAD_MAX_SIZE + 2) // 3 * 4 + 64
+
+    @staticmethod
+    def too_large():
+        return serializers.ValidationError(
+            'Размер изображения превышает '
+            f'{settings.UPLOAD_MAX_SIZE // (1024 * 1024)} МБ.'
+        )
+
+    def check_header(self, file):
+        """Читает только заголовок изображения: формат и размеры."""
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            file.seek(0)
+        if image_format not in self.ALLOWED_FORMATS:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                f'Изображение {width}x{height} слишком велико.'
+            )
+        return image_format
@@ -1,5 +1,4 @@
 from django_filters import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe, Tag
 
@@ -14,10 +13,17 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart',
     )
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'tags']
+        fields = [
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'tags',
+            'search',
+        ]
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
@@ -31,6 +37,8 @@ class RecipeFilter(FilterSet):
             return queryset.filter(in_user_favorite__user=user)
         return queryset
 
-
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
@@ -0,0 +1,101 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZE = settings.IMAGE_THUMBNAIL_SIZE
+FULL_SIZE = settings.IMAGE_FULL_SIZE
+
+VARIANTS = {
+    'thumbnail': (THUMBNAIL_SIZE, 'JPEG', 'thumbnail.jpg'),
+    'thumbnail_webp': (THUMBNAIL_SIZE, 'WEBP', 'thumbnail.webp'),
+    'webp': (FULL_SIZE, 'WEBP', 'full.webp'),
+}
+
+
+def variant_name(name, variant):
+    """Имя производного файла рядом с оригиналом: photo.thumbnail.jpg."""
+    _, _, suffix = VARIANTS[variant]
+    root, _ = os.path.splitext(name)
+    return f'{root}.{suffix}'
+
+
+def ready_field(field_file):
+    """Поле модели, отмечающее, что варианты изображения созданы."""
+    return f'{field_file.field.name}_variants_ready'
+
+
+def variant_urls(field_file):
+    """Ссылки на производные изображения или None, если их ещё нет.
+
+    Наличие вариантов берётся из отметки в модели, а не из хранилища.
+    """
+    if not field_file or not getattr(
+        field_file.instance, ready_field(field_file)
+    ):
+        return None
+    return {
+        variant: field_file.storage.url(variant_name(field_file.name, variant))
+        for variant in VARIANTS
+    }
+
+
+def has_variants(field_file):
+    return all(
+        field_file.storage.exists(variant_name(field_file.name, variant))
+        for variant in VARIANTS
+    )
+
+
+def render_variant(image, size, image_format):
+    image = image.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    if image_format == 'JPEG' or 'A' not in image.getbands():
+        image = image.convert('RGB')
+    else:
+        image = image.convert('RGBA')
+    content = io.BytesIO()
+    image.save(
+        content,
+        image_format,
+        quality=settings.IMAGE_VARIANT_QUALITY,
+        optimize=image_format == 'JPEG',
+    )
+    return content.getvalue()
+
+
+def generate_variants(field_file):
+    """Создаёт уменьшенные копии и WebP-версию изображения.
+
+    Оригинал декодируется один раз и сразу уменьшается до размера
+    полной версии; существующие варианты перезаписываются.
+    """
+    if not field_file:
+        return
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as original:
+        image = Image.open(original)
+        # JPEG декодируется сразу в уменьшенном в 2–8 раз масштабе: полный
+        # кадр на 40 Мпикс занимает в памяти больше сотни мегабайт.
+        image.draft('RGB', FULL_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image.thumbnail(FULL_SIZE, Image.Resampling.LANCZOS)
+    for variant, (size, image_format, _) in VARIANTS.items():
+        name = variant_name(field_file.name, variant)
+        content = render_variant(image, size, image_format)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content))
+
+
+def ensure_variants(field_file):
+    if field_file and not has_variants(field_file):
+        generate_variants(field_file)
+
+
+def delete_variants(storage, name):
+    for variant in VARIANTS:
+        storage.delete(variant_name(name, variant))
@@ -0,0 +1,58 @@
+from bisect import bisect_left
+from threading import Lock
+
+from .cache import get_generation
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientPrefixIndex:
+    """Отсортированный в памяти процесса индекс названий ингредиентов.
+
+    Индекс перестраивается, когда меняется поколение модели Ingredient,
+    поэтому поиск по префиксу обходится без обращения к базе данных.
+    """
+
+    generation_name = Ingredient._meta.label_lower
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._keys = []
+        self._items = []
+
+    def search(self, prefix, limit):
+        keys, items = self._refresh()
+        prefix = normalize(prefix)
+        results = []
+        for index in range(bisect_left(keys, prefix), len(keys)):
+            if len(results) >= limit or not keys[index].startswith(prefix):
+                break
+            results.append(items[index])
+        return results
+
+    def _refresh(self):
+        generation = get_generation(self.generation_name)
+        with self._lock:
+            if generation != self._generation:
+                rows = sorted(
+                    (normalize(name), pk, name, measurement_unit)
+                    for pk, name, measurement_unit in (
+                        Ingredient.objects.values_list(
+                            'id', 'name', 'measurement_unit'
+                        )
+                    )
+                )
+                self._keys = [row[0] for row in rows]
+                self._items = [
+                    {'id': pk, 'name': name, 'measurement_unit': unit}
+                    for _, pk, name, unit in rows
+                ]
+                self._generation = generation
+            return self._keys, self._items
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,228 @@
+import json
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замер задержек, числа SQL-запросов и размера ответов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя для авторизованных запросов; по умолчанию '
+            'берётся пользователь с наибольшим числом подписок',
+        )
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            default=(),
+            help='Замерять только перечисленные сценарии',
+        )
+        parser.add_argument(
+            '--baseline',
+            default='benchmark_baseline.json',
+            help='Файл с эталонными результатами',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Записать результаты как новый эталон',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Допустимый относительный рост p95 и размера ответа',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError('--iterations должно быть не меньше 2')
+        user = self.get_user(options['user'])
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            results = self.run_scenarios(
+                user, self.get_scenarios(user), options
+            )
+        self.print_results(results)
+
+        baseline = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline.write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f'Эталон записан: {baseline}')
+            )
+            return
+        if baseline.exists():
+            self.compare(results, json.loads(baseline.read_text()), options)
+
+    @staticmethod
+    def get_user(username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        user = (
+            users.annotate(subscriptions=Count('subscriber'))
+            .order_by('-subscriptions', 'pk')
+            .first()
+        )
+        if user is None:
+            raise CommandError(
+                'Нет пользователей; заполните базу командой generate_dataset'
+            )
+        return user
+
+    @staticmethod
+    def get_scenarios(user):
+        """Сценарии: название и шаги (авторизация, метод, путь, имя)."""
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        if recipe is None:
+            raise CommandError(
+                'Нет рецептов; заполните базу командой generate_dataset'
+            )
+        paths = {
+            'recipes': '/api/recipes/',
+            'recipes-cursor': '/api/recipes/?pagination=cursor',
+            'recipes-author': f'/api/recipes/?author={recipe.author_id}',
+            'recipes-favorited': '/api/recipes/?is_favorited=1',
+            'recipe-detail': f'/api/recipes/{recipe.pk}/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'feed': '/api/recipes/feed/',
+            'download-shopping-cart': '/api/recipes/download_shopping_cart/',
+        }
+        tag = Tag.objects.order_by('pk').first()
+        if tag is not None:
+            paths['recipes-tags'] = f'/api/recipes/?tags={tag.slug}'
+        ingredient = Ingredient.objects.order_by('pk').first()
+        if ingredient is not None:
+            paths['ingredients-search'] = (
+                f'/api/ingredients/?name={ingredient.name[:2]}'
+            )
+        scenarios = [
+            (
+                'recipes-anonymous',
+                [(False, 'get', '/api/recipes/', 'recipes-anonymous')],
+            ),
+        ] + [
+            (name, [(True, 'get', path, name)]) for name, path in paths.items()
+        ]
+
+        toggled = (
+            Recipe.objects.exclude(in_user_favorite__user=user)
+            .order_by('pk')
+            .first()
+        )
+        if toggled is not None:
+            path = f'/api/recipes/{toggled.pk}/favorite/'
+            scenarios.append(
+                (
+                    'favorite',
+                    [
+                        (True, 'post', path, 'favorite-add'),
+                        (True, 'delete', path, 'favorite-remove'),
+                    ],
+                )
+            )
+        return scenarios
+
+    def run_scenarios(self, user, scenarios, options):
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(user)
+        clients = {False: anonymous, True: authorized}
+        results = {}
+        for name, steps in scenarios:
+            if options['only'] and name not in options['only']:
+                continue
+            samples = {step[3]: [] for step in steps}
+            for iteration in range(options['warmup'] + options['iterations']):
+                for is_authorized, method, path, step_name in steps:
+                    sample = self.measure(
+                        clients[is_authorized], method, path
+                    )
+                    if iteration >= options['warmup']:
+                        samples[step_name].append(sample)
+            for step_name, step_samples in samples.items():
+                results[step_name] = self.summarize(step_samples)
+        return results
+
+    @staticmethod
+    def measure(client, method, path):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = getattr(client, method)(path)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {path}: ответ {response.status_code}'
+            )
+        return elapsed * 1000, len(queries), size
+
+    @staticmethod
+    def summarize(samples):
+        timings = [timing for timing, _, _ in samples]
+        cuts = quantiles(timings, n=100, method='inclusive')
+        return {
+            'p50': round(cuts[49], 3),
+            'p95': round(cuts[94], 3),
+            'p99': round(cuts[98], 3),
+            'queries': max(queries for _, queries, _ in samples),
+            'bytes': max(size for _, _, size in samples),
+        }
+
+    def print_results(self, results):
+        self.stdout.write(
+            '{:<24}{:>10}{:>10}{:>10}{:>9}{:>10}'.format(
+                'сценарий', 'p50, мс', 'p95, мс', 'p99, мс', 'SQL', 'байт'
+            )
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                '{:<24}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}'
+                '{queries:>9}{bytes:>10}'.format(name, **result)
+            )
+
+    def compare(self, results, baseline, options):
+        """Сравнивает с эталоном: рост числа запросов недопустим вовсе."""
+        limit = 1 + options['threshold']
+        failures = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                failures.append(
+                    f'{name}: SQL-запросов {result["queries"]} '
+                    f'вместо {expected["queries"]}'
+                )
+            for metric in ('p95', 'bytes'):
+                if result[metric] > expected[metric] * limit:
+                    failures.append(
+                        f'{name}: {metric} {result[metric]} '
+                        f'при эталоне {expected[metric]}'
+                    )
+        if failures:
+            raise CommandError(
+                'Регрессия относительно эталона:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Результаты в пределах эталона'))
@@ -0,0 +1,47 @@
+from api.images import ensure_variants, generate_variants
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных и WebP-версий загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        process = generate_variants if options['force'] else ensure_variants
+        for model, field in ((Recipe, 'image'), (User, 'avatar')):
+            processed = failed = 0
+            ready = f'{field}_variants_ready'
+            instances = (
+                model.objects.exclude(**{field: ''})
+                .exclude(**{f'{field}__isnull': True})
+                .only('pk', field)
+            )
+            if not options['force']:
+                instances = instances.filter(**{ready: False})
+            for instance in instances.iterator():
+                try:
+                    process(getattr(instance, field))
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(
+                        f'{model.__name__} {instance.pk}: {error}'
+                    )
+                    continue
+                model.objects.filter(pk=instance.pk).update(**{ready: True})
+                processed += 1
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{model._meta.verbose_name_plural}: обработано '
+                    f'{processed}, с ошибками {failed}'
+                )
+            )
@@ -1,6 +1,289 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import get_generation
+
+# SQLite не сообщает диапазон целых полей, поэтому границу BIGINT
+# проверяем явно.
+BIGINT_LIMIT = 2**63
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, кэширующий COUNT(*) для каждого набора фильтров.
+
+    Ключ строится по SQL запроса без сортировки и аннотаций и по
+    поколениям: модели, которое сбрасывается при создании и удалении
+    записей, и переданным generation_names для фильтров по данным
+    пользователя. Для таблиц без фильтров на PostgreSQL можно
+    использовать оценку планировщика.
+    """
+
+    def __init__(self, *args, generation_names=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation_names = generation_names
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        estimate = self.get_estimated_count(queryset)
+        if estimate is not None:
+            return estimate
+        # Аннотации вроде is_favorited зависят от пользователя, но не
+        # влияют на число строк.
+        queryset = queryset.order_by().values('pk')
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        generations = [
+            get_generation(name)
+            for name in (
+                queryset.model._meta.label_lower,
+                *self.generation_names,
+            )
+        ]
+        key = 'count:{}:{}'.format(
+            ':'.join(map(str, generations)),
+            md5(f'{sql}{params!r}'.encode('utf-8')).hexdigest(),
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    @staticmethod
+    def get_estimated_count(queryset):
+        threshold = settings.PAGINATION_ESTIMATE_COUNT_THRESHOLD
+        connection = connections[queryset.db]
+        if (
+            threshold is None
+            or connection.vendor != 'postgresql'
+            or queryset.query.where
+        ):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < threshold:
+            return None
+        return int(row[0])
 
 
 class PageLimitPaginator(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size = 6
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        get_generations = getattr(view, 'get_count_generations', None)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            generation_names=get_generations() if get_generations else (),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPaginator(BasePagination):
+    """Курсорная пагинация по набору уникальных полей сортировки.
+
+    Страница выбирается условием по значениям полей последней записи
+    предыдущей страницы, поэтому запрос не использует OFFSET и COUNT(*).
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+        if position is not None:
+            position = self.parse_position(queryset.model, position)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(ordering, position)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, ordering, position):
+        """Строит лексикографическое условие «после позиции»."""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def get_position(self, instance):
+        return [
+            str(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse, position = bool(cursor['r']), list(cursor['p'])
+        except (
+            binascii.Error,
+            KeyError,
+            TypeError,
+            UnicodeError,
+            ValueError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def parse_position(self, model, position):
+        """Приводит значения курсора к типам полей сортировки."""
+        values = []
+        for field_name, value in zip(self.ordering, position):
+            field = model._meta.get_field(field_name.lstrip('-'))
+            field = getattr(field, 'target_field', field)
+            try:
+                value = field.to_python(value)
+                if value is None or (
+                    isinstance(value, int)
+                    and not -BIGINT_LIMIT <= value < BIGINT_LIMIT
+                ):
+                    raise ValidationError(self.invalid_cursor_message)
+                field.run_validators(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, reverse, position):
+        cursor = json.dumps({'r': int(reverse), 'p': position})
+        encoded = urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encoded,
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(True, self.get_position(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ('next', self.get_next_link()),
+                    ('previous', self.get_previous_link()),
+                    ('results', data),
+                ]
+            )
+        )
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class FeedPaginator(KeysetPaginator):
+    """Курсор по записям ленты: диапазон индекса (подписчик, дата, id)."""
+
+    ordering = ('-created_at', '-recipe_id')
+
+
+class KeysetPaginationMixin:
+    """Включает курсорную пагинацию по параметру ?pagination=cursor.
+
+    Параметры из keyset_incompatible_params задают свой порядок выдачи
+    (например, по релевантности поиска), который курсор по keyset_ordering
+    потерял бы: с ними всегда используется постраничная пагинация.
+    """
+
+    keyset_pagination_class = KeysetPaginator
+    keyset_query_param = 'pagination'
+    keyset_incompatible_params = ()
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = getattr(self.request, 'query_params', {})
+            if not any(
+                query_params.get(param, '').strip()
+                for param in self.keyset_incompatible_params
+            ) and (
+                query_params.get(self.keyset_query_param) == 'cursor'
+                or self.keyset_pagination_class.cursor_query_param
+                in query_params
+            ):
+                self._paginator = self.keyset_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
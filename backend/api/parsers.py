@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data с полями в JSON-строке части data.
+
+    Файлы передаются отдельными частями и потоково пишутся во временные
+    файлы, а вложенные структуры (ингредиенты, теги) остаются в JSON.
+    """
+
+    json_field = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if self.json_field not in result.data:
+            return result
+        try:
+            data = json.loads(result.data[self.json_field])
+        except ValueError as error:
+            raise ParseError(f'Некорректный JSON в части data: {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Часть data должна содержать JSON-объект.')
+        # Request объединяет data и files через dict.update, поэтому файлы
+        # передаются обычным словарём, а не MultiValueDict со списками.
+        files = {name: result.files[name] for name in result.files}
+        return DataAndFiles(data, files)
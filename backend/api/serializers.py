@@ -1,15 +1,33 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Manager, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from .constants import MAX_AMOUNT, MAX_TIME, MIN_AMOUNT, MIN_TIME
+from .cache import recipe_fragment_keys
+from .constants import (
+    BATCH_RECIPES_LIMIT,
+    MAX_AMOUNT,
+    MAX_TIME,
+    MIN_AMOUNT,
+    MIN_TIME,
+)
+from .counters import change_counter
+from .fields import HybridImageField
+from .images import variant_urls
 from recipes.models import (
     FavoriteRecipe,
+    FeedEntry,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Subscription
@@ -17,9 +35,24 @@ from users.models import Subscription
 User = get_user_model()
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные и WebP-версии изображения."""
+
+    def to_representation(self, value):
+        urls = variant_urls(value)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField(allow_null=True, required=False)
+    avatar = HybridImageField(allow_null=True, required=False)
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
@@ -31,17 +64,22 @@ class CustomUserSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return request.user.subscriber.filter(author=obj).exists()
+        if 'subscribed_author_ids' not in self.context:
+            self.context['subscribed_author_ids'] = set(
+                request.user.subscriber.values_list('author_id', flat=True)
+            )
+        return obj.id in self.context['subscribed_author_ids']
 
 
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField()
+    avatar = HybridImageField()
 
     class Meta:
         model = User
@@ -86,7 +124,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
 
 
 class IngrediendRecipeWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         min_value=MIN_AMOUNT, max_value=MAX_AMOUNT
     )
@@ -97,11 +135,12 @@ class IngrediendRecipeWriteSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(required=True)
+    image = HybridImageField(required=True)
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
 
 
 class BaseRecipeSerializer(ShortRecipeSerializer):
@@ -120,24 +159,91 @@ class BaseRecipeSerializer(ShortRecipeSerializer):
         ]
 
 
-class FullRecipeSerializer(BaseRecipeSerializer):
+class RecipeFragmentSerializer(BaseRecipeSerializer):
+    """Часть рецепта, одинаковая для всех пользователей.
+
+    Рендерится без запроса в контексте: ссылки на изображения остаются
+    относительными, а is_subscribed автора равен False.
+    """
+
     tags = TagSerializer(read_only=True, many=True)
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(iterable))
+
+
+class FullRecipeSerializer(RecipeFragmentSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
-    class Meta(BaseRecipeSerializer.Meta):
-        fields = BaseRecipeSerializer.Meta.fields + [
+    class Meta(RecipeFragmentSerializer.Meta):
+        fields = RecipeFragmentSerializer.Meta.fields + [
             'is_in_shopping_cart',
             'is_favorited',
         ]
+        list_serializer_class = RecipeFragmentListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        """Собирает рецепты из кэша фрагментов и флагов пользователя."""
+        keys = recipe_fragment_keys(recipe.pk for recipe in recipes)
+        fragments = cache.get_many(keys.values())
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in fragments
+        ]
+        if missing:
+            prefetch_related_objects(
+                missing, 'recipe_ingredients__ingredient', 'tags'
+            )
+            rendered = {
+                keys[recipe.pk]: RecipeFragmentSerializer(recipe).data
+                for recipe in missing
+            }
+            cache.set_many(rendered, settings.FRAGMENT_CACHE_TIMEOUT)
+            fragments.update(rendered)
+        return [
+            self.overlay(fragments[keys[recipe.pk]], recipe)
+            for recipe in recipes
+        ]
+
+    def overlay(self, fragment, recipe):
+        request = self.context.get('request')
+        data = dict(fragment)
+        data['author'] = author = dict(fragment['author'])
+        author['is_subscribed'] = self.fields['author'].get_is_subscribed(
+            recipe.author
+        )
+        if request is not None:
+            for item in (data, author):
+                for field in ('image', 'avatar'):
+                    if item.get(field):
+                        item[field] = request.build_absolute_uri(item[field])
+                for field in ('image_variants', 'avatar_variants'):
+                    if item.get(field):
+                        item[field] = {
+                            variant: request.build_absolute_uri(url)
+                            for variant, url in item[field].items()
+                        }
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        return data
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.in_shopping_cart.filter(user=request.user).exists()
         return False
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.in_user_favorite.filter(user=request.user).exists()
@@ -145,12 +251,12 @@ class FullRecipeSerializer(BaseRecipeSerializer):
 
 
 class CreateRecipeSerializer(BaseRecipeSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True,
     )
     ingredients = IngrediendRecipeWriteSerializer(many=True)
-    image = Base64ImageField()
+    image = HybridImageField()
     cooking_time = serializers.IntegerField(
         min_value=MIN_TIME, max_value=MAX_TIME
     )
@@ -168,6 +274,18 @@ class CreateRecipeSerializer(BaseRecipeSerializer):
             ]
         )
 
+    @staticmethod
+    def get_objects(model, ids, message):
+        """Загружает объекты по id одним запросом, сообщая обо всех
+        отсутствующих сразу."""
+        objects = model.objects.in_bulk(ids)
+        missing = [str(pk) for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(
+                f'{message}: {", ".join(missing)}'
+            )
+        return objects
+
     def validate(self, attrs):
         if not attrs.get('image'):
             raise serializers.ValidationError(
@@ -186,6 +304,11 @@ class CreateRecipeSerializer(BaseRecipeSerializer):
             raise serializers.ValidationError(
                 'Ингредиенты не могут повторяться'
             )
+        ingredients = self.get_objects(
+            Ingredient, ingredient_ids, 'Ингредиенты не найдены'
+        )
+        for item in value:
+            item['id'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
@@ -195,23 +318,73 @@ class CreateRecipeSerializer(BaseRecipeSerializer):
             )
         if len(value) != len(set(value)):
             raise serializers.ValidationError('Теги не могут повторяться')
-        return value
+        tags = self.get_objects(Tag, value, 'Теги не найдены')
+        return [tags[pk] for pk in value]
 
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         user = self.context.get('request').user
-        instance = Recipe.objects.create(**validated_data, author=user)
-        instance.tags.set(tags)
-        self.create_ingredient_in_recipe(instance, ingredients)
+        with transaction.atomic():
+            instance = Recipe.objects.create(**validated_data, author=user)
+            instance.tags.set(tags)
+            self.create_ingredient_in_recipe(instance, ingredients)
+            change_counter(User, [user.id], 'recipes_count', 1)
+            FeedEntry.objects.fan_out(instance)
         return instance
 
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        """Приводит ингредиенты рецепта к новому списку минимумом запросов.
+
+        Возвращает изменения количеств по ингредиентам для списков покупок.
+        """
+        existing = {
+            row.ingredient_id: row for row in instance.recipe_ingredients.all()
+        }
+        incoming = {item['id'].pk: item['amount'] for item in ingredients}
+        amounts = Counter()
+        removed, changed, created = [], [], []
+        for ingredient_id, row in existing.items():
+            if ingredient_id not in incoming:
+                removed.append(row.pk)
+                amounts[ingredient_id] -= row.amount
+        for ingredient_id, amount in incoming.items():
+            row = existing.get(ingredient_id)
+            if row is None:
+                created.append(
+                    IngredientRecipe(
+                        recipe=instance,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                )
+                amounts[ingredient_id] += amount
+            elif row.amount != amount:
+                amounts[ingredient_id] += amount - row.amount
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        if created:
+            IngredientRecipe.objects.bulk_create(created)
+        return amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
+        amounts = self.update_ingredients(instance, ingredients)
         instance.tags.set(tags)
-        self.create_ingredient_in_recipe(instance, ingredients)
+        if any(amounts.values()):
+            ShoppingListItem.objects.apply(
+                list(instance.in_shopping_cart.values_list('user', flat=True)),
+                amounts,
+            )
+        # Сохранение рецепта сбрасывает кэш фрагмента и ответов, в том
+        # числе после массовых операций с ингредиентами без сигналов.
         return super().update(instance, validated_data)
 
 
@@ -243,9 +416,20 @@ class FavoriteSerializer(ShoppingCartSerializer):
         return data
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BATCH_RECIPES_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class SubscriberDetailSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -254,21 +438,49 @@ class SubscriberDetailSerializer(CustomUserSerializer):
             'recipes',
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            recipes_limit = int(request.query_params.get('recipes_limit'))
+        except (ValueError, TypeError):
+            return None
+        return recipes_limit if recipes_limit > 0 else None
 
-    def get_recipes(self, obj):
-        queryset = obj.recipes.all()
-        request = self.context['request']
-        recipes_limit = request.query_params.get('recipes_limit')
+    @staticmethod
+    def prefetch_recipes(authors, recipes_limit=None):
+        """Загружает последние рецепты авторов одним запросом."""
+        if not authors:
+            return
+        recipes = Recipe.objects.filter(author__in=authors)
+        if recipes_limit is not None:
+            ranked = recipes.annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('created_at').desc(), F('id').desc()),
+                )
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE ranked.recipe_rank <= %s '
+                'ORDER BY ranked.author_id, ranked.recipe_rank',
+                (*params, recipes_limit),
+            )
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = recipes_by_author[author.id]
 
-        try:
+    def get_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            queryset = obj.latest_recipes
+        else:
+            queryset = obj.recipes.all()
+            recipes_limit = self.get_recipes_limit(self.context['request'])
             if recipes_limit is not None:
-                recipes_limit = int(recipes_limit)
-                if recipes_limit > 0:
-                    queryset = queryset[:recipes_limit]
-        except (ValueError, TypeError):
-            pass
+                queryset = queryset[:recipes_limit]
 
         return ShortRecipeSerializer(
             queryset,
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from hashlib import md5
+
+from django.core.cache import cache
+
+from .cache import RECIPE_RESPONSES, get_generation
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def render_txt(rows):
+    for name, measurement_unit, total_amount in rows:
+        yield f'{name}({measurement_unit}) - {total_amount}\n'
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_json(rows):
+    separator = '['
+    for name, measurement_unit, total_amount in rows:
+        yield separator + json.dumps(
+            {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': total_amount,
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
+
+
+def get_cache_key(recipe_ids, export_format):
+    """Ключ списка покупок, зависящий только от содержимого корзины."""
+    contents = ','.join(str(recipe_id) for recipe_id in recipe_ids)
+    return 'shopping-list:{}:{}:{}'.format(
+        export_format,
+        get_generation(RECIPE_RESPONSES),
+        md5(contents.encode('utf-8')).hexdigest(),
+    )
+
+
+def stream_and_cache(rows, export_format, cache_key, timeout):
+    """Отдаёт строки файла по мере чтения и кэширует полный результат."""
+    chunks = []
+    for chunk in RENDERERS[export_format](rows):
+        chunks.append(chunk)
+        yield chunk
+    cache.set(cache_key, ''.join(chunks), timeout)
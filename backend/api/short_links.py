@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from recipes.models import Recipe
+
+# Только буквы: коды не пересекаются со старыми ссылками вида /s/<id>.
+ALPHABET = 'kZqHwXbNtRmVfLcJpYdGsTzBhQxKnWvMgPrCjFlDySoUaEeOuAiI'
+BASE = len(ALPHABET)
+INDEX = {char: position for position, char in enumerate(ALPHABET)}
+
+
+def encode(pk):
+    code = ''
+    while True:
+        pk, remainder = divmod(pk, BASE)
+        code = ALPHABET[remainder] + code
+        if not pk:
+            return code
+
+
+# id хранится в BIGINT: более длинные коды заведомо не существуют.
+MAX_PK = 2**63 - 1
+MAX_CODE_LENGTH = len(encode(MAX_PK))
+ZERO = ALPHABET[0]
+
+
+def decode(code):
+    """Возвращает id рецепта или None для некорректного кода.
+
+    Код с ведущим нулевым символом отклоняется, чтобы у каждого id была
+    единственная ссылка.
+    """
+    if len(code) > MAX_CODE_LENGTH or (len(code) > 1 and code[0] == ZERO):
+        return None
+    pk = 0
+    for char in code:
+        if char not in INDEX:
+            return None
+        pk = pk * BASE + INDEX[char]
+    return pk if pk <= MAX_PK else None
+
+
+class RecipeExistenceCache:
+    """LRU-кэш в памяти процесса: существует ли рецепт с данным id.
+
+    Отсутствующие id тоже кэшируются, чтобы перебор ссылок не нагружал
+    базу. Записи в других процессах устаревают по таймауту.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._lock = Lock()
+        self._items = OrderedDict()
+
+    def exists(self, pk):
+        # id вне диапазона BIGINT не проверяется и не занимает место в кэше.
+        if not 0 < pk <= MAX_PK:
+            return False
+        now = monotonic()
+        with self._lock:
+            item = self._items.get(pk)
+            if item is not None and item[1] > now:
+                self._items.move_to_end(pk)
+                return item[0]
+        exists = Recipe.objects.filter(pk=pk).exists()
+        with self._lock:
+            self._items[pk] = (exists, now + self.timeout)
+            self._items.move_to_end(pk)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return exists
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._items.pop(pk, None)
+
+
+recipe_existence = RecipeExistenceCache(
+    settings.SHORT_LINK_CACHE_SIZE, settings.SHORT_LINK_CACHE_TIMEOUT
+)
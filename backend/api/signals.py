@@ -0,0 +1,286 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import (
+    FAVORITES,
+    RECIPE_FRAGMENTS,
+    RECIPE_RESPONSES,
+    SHOPPING_CART,
+    SUBSCRIPTIONS,
+    bump_generation,
+    invalidate_recipe_fragments,
+    user_generation,
+)
+from .counters import change_counter
+from .images import delete_variants, ensure_variants, ready_field
+from .short_links import recipe_existence
+from .view_counter import recipe_views
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import Subscription
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+INGREDIENTS = Ingredient._meta.label_lower
+RECIPES = Recipe._meta.label_lower
+TAGS = Tag._meta.label_lower
+IMAGE_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def bump_count_on_create(sender, created, **kwargs):
+    if created:
+        name = sender._meta.label_lower
+        transaction.on_commit(lambda: bump_generation(name))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def bump_count_on_delete(sender, **kwargs):
+    name = sender._meta.label_lower
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+@receiver(post_save, sender=Recipe)
+def bump_count_on_search_update(sender, created, update_fields, **kwargs):
+    # Смена названия или описания меняет состав выдачи поиска.
+    if not created and (
+        update_fields is None
+        or set(update_fields) & set(Recipe.SEARCH_FIELDS)
+    ):
+        transaction.on_commit(lambda: bump_generation(RECIPES))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_count(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(lambda: bump_generation(RECIPES))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def bump_user_recipes(sender, instance, **kwargs):
+    # Избранное и корзина влияют только на счётчики их владельца.
+    name = user_generation(
+        FAVORITES if sender is FavoriteRecipe else SHOPPING_CART,
+        instance.user_id,
+    )
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_user_subscriptions(sender, instance, **kwargs):
+    name = user_generation(SUBSCRIPTIONS, instance.subscriber_id)
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+@receiver(pre_delete, sender=User)
+def release_user_counters(sender, instance, **kwargs):
+    """Уменьшает счётчики, которые теряют строки каскадного удаления.
+
+    Каскад удаляет избранное, корзину и подписки пользователя без
+    обработчиков представлений, а вместе с рецептами пользователя — и
+    их строки в чужих корзинах.
+    """
+    for relation, field in (
+        (instance.user_favorite, 'favorites_count'),
+        (instance.user_shopping_cart, 'in_carts_count'),
+    ):
+        change_counter(
+            Recipe, list(relation.values_list('recipe', flat=True)), field, -1
+        )
+    change_counter(
+        User,
+        list(instance.subscriber.values_list('author', flat=True)),
+        'subscribers_count',
+        -1,
+    )
+    carts = {}
+    for user_id, recipe_id in (
+        ShoppingCart.objects.filter(recipe__author=instance)
+        .exclude(user=instance)
+        .values_list('user', 'recipe')
+    ):
+        carts.setdefault(user_id, []).append(recipe_id)
+    for user_id, recipe_ids in carts.items():
+        ShoppingListItem.objects.remove_recipes([user_id], recipe_ids)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients(sender, **kwargs):
+    transaction.on_commit(lambda: bump_generation(INGREDIENTS))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags(sender, **kwargs):
+    transaction.on_commit(lambda: bump_generation(TAGS))
+
+
+def is_login_update(update_fields):
+    return update_fields is not None and set(update_fields) <= {'last_login'}
+
+
+def delete_unused_variants(sender, storage, name):
+    # Сгенерированные рецепты делят одно изображение.
+    if not sender.objects.filter(**{IMAGE_FIELDS[sender]: name}).exists():
+        delete_variants(storage, name)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_image(sender, instance, update_fields, **kwargs):
+    field = IMAGE_FIELDS[sender]
+    if instance.pk is None or (
+        update_fields is not None and field not in update_fields
+    ):
+        return
+    instance._previous_image = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list(field, flat=True)
+        .first()
+    )
+
+
+# Обработчики изображений объявлены до сброса кэшей: варианты должны
+# появиться раньше, чем ответы и фрагменты начнут строиться заново.
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def update_image_variants(sender, instance, update_fields, **kwargs):
+    previous = instance.__dict__.pop('_previous_image', None)
+    if is_login_update(update_fields):
+        return
+    image = getattr(instance, IMAGE_FIELDS[sender])
+
+    def update():
+        if previous and previous != image.name:
+            delete_unused_variants(sender, image.storage, previous)
+        ready = False
+        if image:
+            try:
+                ensure_variants(image)
+                ready = True
+            except OSError:
+                logger.exception('Не удалось создать варианты %s', image)
+        field = ready_field(image)
+        setattr(instance, field, ready)
+        sender.objects.filter(pk=instance.pk).update(**{field: ready})
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def delete_image_variants(sender, instance, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    if image:
+        name = image.name
+        transaction.on_commit(
+            lambda: delete_unused_variants(sender, image.storage, name)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_recipe_responses(sender, **kwargs):
+    transaction.on_commit(lambda: bump_generation(RECIPE_RESPONSES))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_recipe_fragments(sender, **kwargs):
+    transaction.on_commit(lambda: bump_generation(RECIPE_FRAGMENTS))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    pks = [instance.pk]
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    pks = [instance.recipe_id]
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_relations(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+        transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+    elif pk_set:
+        pks = list(pk_set)
+        transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+    else:
+        transaction.on_commit(lambda: bump_generation(RECIPE_FRAGMENTS))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, update_fields, **kwargs):
+    if is_login_update(update_fields):
+        return
+    pks = list(instance.recipes.values_list('pk', flat=True))
+
+    def invalidate():
+        invalidate_recipe_fragments(pks)
+        bump_generation(RECIPE_RESPONSES)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_search_entry(sender, instance, using, **kwargs):
+    sender.objects.using(using).delete_search_entries([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_short_link(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: recipe_existence.invalidate(pk))
+
+
+@receiver(request_finished)
+def flush_recipe_views(sender, **kwargs):
+    recipe_views.flush_due()
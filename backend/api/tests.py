@@ -0,0 +1,770 @@
+import io
+import json
+import tempfile
+from base64 import b64encode, urlsafe_b64encode
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F, PositiveIntegerField, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import short_links
+from .cache import get_generation, recipe_fragment_keys
+from .serializers import CreateRecipeSerializer
+from .view_counter import recipe_views
+from recipes.models import (
+    FeedEntry,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
+
+User = get_user_model()
+
+LOCMEM_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов страницы рецептов не зависит от её размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='password',
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        for index in range(25):
+            author = User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                first_name='Автор',
+                last_name=f'Номер {index}',
+                password='password',
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {index}',
+                text='Описание рецепта',
+                image='recipes/images/test.png',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[: index % 3 + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+                for ingredient in ingredients[: index % 5 + 1]
+            )
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(self.user)
+
+    def assert_constant_queries(self, client):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        cache.clear()
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = client.get('/api/recipes/?limit=20')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_anonymous_list_queries_do_not_grow(self):
+        self.assert_constant_queries(self.anonymous)
+
+    def test_authorized_list_queries_do_not_grow(self):
+        self.assert_constant_queries(self.authorized)
+
+
+class SubscriptionsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(
+                username='newcomer',
+                email='newcomer@example.com',
+                first_name='Новый',
+                last_name='Пользователь',
+                password='password',
+            )
+        )
+
+    def test_empty_subscriptions_with_recipes_limit(self):
+        for url in (
+            '/api/users/subscriptions/?recipes_limit=2',
+            '/api/users/subscriptions/?recipes_limit=2&pagination=cursor',
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['results'], [])
+
+
+class KeysetCursorTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @staticmethod
+    def encode(position):
+        cursor = json.dumps({'r': 0, 'p': position}).encode('utf-8')
+        return urlsafe_b64encode(cursor).decode('ascii')
+
+    def test_invalid_cursor_values(self):
+        for position in (
+            ['zzz', '1'],
+            [None, '1'],
+            ['2024-01-01 00:00:00+00:00', 'abc'],
+            ['2024-01-01 00:00:00+00:00', str(2**70)],
+        ):
+            with self.subTest(position=position):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': self.encode(position)}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_valid_cursor(self):
+        response = self.client.get(
+            '/api/recipes/',
+            {'cursor': self.encode(['2024-01-01 00:00:00+00:00', '1'])},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CachedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = (
+            User.objects.create_user(
+                username=f'user{index}',
+                email=f'user{index}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            for index in range(2)
+        )
+        cls.recipes = [cls.create_recipe(index) for index in range(3)]
+
+    @classmethod
+    def create_recipe(cls, index):
+        return Recipe.objects.create(
+            author=cls.first,
+            name=f'Рецепт {index}',
+            text='Описание рецепта',
+            image='recipes/images/test.png',
+            cooking_time=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_count(self, user, url='/api/recipes/'):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url).data['count']
+
+    def add_silently(self):
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author=self.first,
+                    name='Без сигналов',
+                    text='Описание рецепта',
+                    image='recipes/images/test.png',
+                    cooking_time=10,
+                )
+            ]
+        )
+
+    def test_count_is_shared_between_users(self):
+        self.assertEqual(self.get_count(self.first), 3)
+        self.add_silently()
+        self.assertEqual(self.get_count(self.second), 3)
+
+    def test_favorite_invalidates_only_owner_counts(self):
+        url = '/api/recipes/?is_favorited=1'
+        self.assertEqual(self.get_count(self.first), 3)
+        self.assertEqual(self.get_count(self.first, url), 0)
+        self.add_silently()
+        client = APIClient()
+        client.force_authenticate(self.first)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        self.assertEqual(self.get_count(self.first, url), 1)
+        self.assertEqual(self.get_count(self.second), 3)
+
+    def test_generation_is_bumped_after_commit(self):
+        label = User._meta.label_lower
+        generation = get_generation(label)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(
+                username='late',
+                email='late@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            self.assertEqual(get_generation(label), generation)
+        self.assertNotEqual(get_generation(label), generation)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RecipeFragmentCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='password',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Описание рецепта',
+            image='recipes/images/test.png',
+            cooking_time=10,
+        )
+        cls.item = IngredientRecipe.objects.create(
+            recipe=cls.recipe,
+            ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'
+            ),
+            amount=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.recipe.author)
+
+    def get_amount(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        return response.data['ingredients'][0]['amount']
+
+    def test_late_write_of_stale_fragment_is_ignored(self):
+        self.assertEqual(self.get_amount(), 5)
+        stale = cache.get_many(
+            recipe_fragment_keys([self.recipe.pk]).values()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.amount = 7
+            self.item.save()
+        # Медленный читатель сохраняет фрагмент уже после инвалидации.
+        cache.set_many(stale)
+        self.assertEqual(self.get_amount(), 7)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReferenceDataEtagTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_until_table_changes(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ShoppingListTest(TestCase):
+    """Списки покупок совпадают с суммой ингредиентов рецептов корзины."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user = (
+            User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            for username in ('author', 'buyer')
+        )
+        cls.salt, cls.sugar, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Мука')
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.first = cls.create_recipe({cls.salt: 5, cls.sugar: 10})
+        cls.second = cls.create_recipe({cls.salt: 3, cls.flour: 200})
+
+    @classmethod
+    def create_recipe(cls, amounts):
+        recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание рецепта',
+            image='',
+            cooking_time=10,
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in amounts.items()
+        )
+        User.objects.filter(pk=cls.author.pk).update(
+            recipes_count=F('recipes_count') + 1
+        )
+        return recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_list_matches_cart(self):
+        expected = dict(
+            IngredientRecipe.objects.filter(
+                recipe__in_shopping_cart__user=self.user
+            )
+            .order_by()
+            .values('ingredient')
+            .annotate(total=Sum('amount'))
+            .values_list('ingredient', 'total')
+        )
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    'ingredient', 'total_amount'
+                )
+            ),
+            expected,
+        )
+
+    def test_add_and_remove(self):
+        for recipe in (self.first, self.second):
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+            self.assert_list_matches_cart()
+        self.client.delete(f'/api/recipes/{self.first.pk}/shopping_cart/')
+        self.assert_list_matches_cart()
+        self.client.delete(f'/api/recipes/{self.first.pk}/shopping_cart/')
+        self.assert_list_matches_cart()
+
+    def test_batch(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        recipes = {'recipes': [self.first.pk, self.second.pk]}
+        self.client.post(f'/api/recipes/{self.first.pk}/shopping_cart/')
+        self.client.post(url, recipes, format='json')
+        self.assert_list_matches_cart()
+        self.assertEqual(
+            list(
+                Recipe.objects.filter(pk__in=recipes['recipes']).values_list(
+                    'in_carts_count', flat=True
+                )
+            ),
+            [1, 1],
+        )
+        self.client.delete(url, {'recipes': [self.second.pk]}, format='json')
+        self.assert_list_matches_cart()
+        self.client.delete(url, recipes, format='json')
+        self.assert_list_matches_cart()
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+
+    def test_recipe_delete(self):
+        self.client.post(
+            '/api/recipes/shopping_cart/batch/',
+            {'recipes': [self.first.pk, self.second.pk]},
+            format='json',
+        )
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.delete(f'/api/recipes/{self.first.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_list_matches_cart()
+
+    def test_recipe_update(self):
+        self.client.post(f'/api/recipes/{self.first.pk}/shopping_cart/')
+        self.client.post(f'/api/recipes/{self.second.pk}/shopping_cart/')
+        serializer = CreateRecipeSerializer(self.first)
+        serializer.update(
+            self.first,
+            {
+                'ingredients': [
+                    {'id': self.salt, 'amount': 7},
+                    {'id': self.flour, 'amount': 50},
+                ],
+                'tags': [self.tag],
+            },
+        )
+        self.assertEqual(
+            dict(
+                self.first.recipe_ingredients.values_list(
+                    'ingredient', 'amount'
+                )
+            ),
+            {self.salt.pk: 7, self.flour.pk: 50},
+        )
+        self.assert_list_matches_cart()
+
+
+class UserCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            for username in ('author', 'reader')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание рецепта',
+            image='',
+            cooking_time=10,
+        )
+
+    def test_full_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        client.post(f'/api/users/{self.author.pk}/subscribe/')
+        stale.first_name = 'Новое имя'
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.first_name, 'Новое имя')
+        self.assertEqual(self.author.subscribers_count, 1)
+
+    def test_delete_releases_counters(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        client.post(f'/api/users/{self.author.pk}/subscribe/')
+        client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.reader.delete()
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+
+
+class ImageVariantsTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            username='user',
+            email='user@example.com',
+            first_name='Имя',
+            last_name='Фамилия',
+            password='password',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def encode_image():
+        content = io.BytesIO()
+        Image.new('RGB', (32, 32), (200, 120, 60)).save(content, 'PNG')
+        return 'data:image/png;base64,' + b64encode(
+            content.getvalue()
+        ).decode('ascii')
+
+    def get_variants(self):
+        with mock.patch.object(
+            default_storage, 'exists', wraps=default_storage.exists
+        ) as exists:
+            response = self.client.get(f'/api/users/{self.user.pk}/')
+        self.assertFalse(exists.called)
+        return response.data['avatar_variants']
+
+    def test_variants_are_recorded_on_generation(self):
+        self.assertIsNone(self.get_variants())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                '/api/users/me/avatar/',
+                {'avatar': self.encode_image()},
+                format='json',
+            )
+        variants = self.get_variants()
+        self.assertEqual(
+            set(variants), {'thumbnail', 'thumbnail_webp', 'webp'}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/users/me/avatar/')
+        self.assertIsNone(self.get_variants())
+
+
+@override_settings(FEED_FANOUT_LIMIT=1, FEED_PULL_LIMIT=2)
+class FeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.fan, cls.author, cls.popular = (
+            User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='password',
+            )
+            for username in ('reader', 'fan', 'author', 'popular')
+        )
+        cls.recipes = [
+            cls.create_recipe(author, index)
+            for author in (cls.author, cls.popular)
+            for index in range(3)
+        ]
+
+    @staticmethod
+    def create_recipe(author, index):
+        return Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {index}',
+            text='Описание рецепта',
+            image='',
+            cooking_time=10,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def get_feed(self):
+        response = self.client_for(self.reader).get(
+            '/api/recipes/feed/', {'limit': 10}
+        )
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def subscribe(self, user, author):
+        self.client_for(user).post(f'/api/users/{author.pk}/subscribe/')
+
+    def test_feed(self):
+        _, second, third, *popular = (
+            recipe.pk for recipe in self.recipes
+        )
+        self.subscribe(self.fan, self.popular)
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.reader, self.popular)
+        # Подписка добавляет только последние FEED_PULL_LIMIT рецептов, а
+        # рецепты автора с подписчиками больше FEED_FANOUT_LIMIT не
+        # раскладываются по лентам.
+        self.assertEqual(
+            set(
+                self.reader.feed_entries.values_list('recipe', flat=True)
+            ),
+            {second, third},
+        )
+        latest = self.create_recipe(self.author, 3)
+        FeedEntry.objects.fan_out(latest)
+        self.assertEqual(
+            self.get_feed(),
+            [latest.pk, popular[2], popular[1], third, second],
+        )
+        self.client_for(self.reader).delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(self.get_feed(), [popular[2], popular[1]])
+
+    def test_rebuild_matches_subscriptions(self):
+        self.subscribe(self.fan, self.popular)
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.reader, self.popular)
+        entries = set(self.reader.feed_entries.values_list('recipe'))
+        FeedEntry.objects.rebuild()
+        self.assertEqual(
+            set(self.reader.feed_entries.values_list('recipe')), entries
+        )
+
+
+class ShortLinkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                username='author',
+                email='author@example.com',
+                first_name='Автор',
+                last_name='Рецептов',
+                password='password',
+            ),
+            name='Рецепт',
+            text='Описание рецепта',
+            image='recipes/images/test.png',
+            cooking_time=10,
+        )
+
+    def test_code_redirects_to_recipe(self):
+        code = short_links.encode(self.recipe.pk)
+        response = self.client.get(f'/s/{code}')
+        self.assertRedirects(
+            response,
+            f'/recipes/{self.recipe.pk}/',
+            fetch_redirect_response=False,
+        )
+
+    def test_invalid_codes(self):
+        code = short_links.encode(self.recipe.pk)
+        for path in (
+            '/s/' + 'Z' * 40,
+            f'/s/{short_links.ZERO}{code}',
+            f'/s/{2**70}',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_get_link(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/get-link/')
+        self.assertTrue(
+            response.data['short-link'].endswith(
+                f'/s/{short_links.encode(self.recipe.pk)}'
+            )
+        )
+        for pk in (2**70, '²'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/recipes/{pk}/get-link/')
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeViewsTest(TestCase):
+    def test_views_are_flushed_after_any_request(self):
+        recipe_views.flush()
+        recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                username='author',
+                email='author@example.com',
+                first_name='Автор',
+                last_name='Рецептов',
+                password='password',
+            ),
+            name='Рецепт',
+            text='Описание рецепта',
+            image='',
+            cooking_time=10,
+        )
+        self.client.get(f'/api/recipes/{recipe.pk}/')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.views_count, 0)
+        with mock.patch.object(recipe_views, 'interval', 0):
+            self.client.get('/api/tags/')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.views_count, 1)
+
+
+class RecipeSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                username='author',
+                email='author@example.com',
+                first_name='Автор',
+                last_name='Рецептов',
+                password='password',
+            ),
+            name='Борщ',
+            text='Свекла и капуста',
+            image='recipes/images/test.png',
+            cooking_time=10,
+        )
+
+    def rename(self, name):
+        self.recipe.name = name
+        self.recipe.save()
+
+    def test_cursor_pagination_keeps_ranking(self):
+        later = Recipe.objects.create(
+            author=self.recipe.author,
+            name='Суп',
+            text='Сварите борщ',
+            image='',
+            cooking_time=10,
+        )
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'pagination': 'cursor'}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipe.pk, later.pk],
+        )
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(list(Recipe.objects.search('борщ')), [self.recipe])
+        self.rename('Щи')
+        self.assertFalse(Recipe.objects.search('борщ').exists())
+        self.assertEqual(list(Recipe.objects.search('щи')), [self.recipe])
+        self.recipe.delete()
+        self.assertFalse(Recipe.objects.search('щи').exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'таблица FTS5 есть только в SQLite')
+class RecipeSearchTableRebuildTest(TransactionTestCase):
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                username='author',
+                email='author@example.com',
+                first_name='Автор',
+                last_name='Рецептов',
+                password='password',
+            ),
+            name='Борщ',
+            text='Свекла и капуста',
+            image='',
+            cooking_time=10,
+        )
+
+    def alter_cooking_time(self, old_field, new_field):
+        with connection.schema_editor() as editor:
+            editor.alter_field(Recipe, old_field, new_field)
+
+    def test_index_survives_table_rebuild(self):
+        old_field = Recipe._meta.get_field('cooking_time')
+        new_field = PositiveIntegerField()
+        new_field.set_attributes_from_name('cooking_time')
+        new_field.model = Recipe
+        self.alter_cooking_time(old_field, new_field)
+        self.addCleanup(self.alter_cooking_time, new_field, old_field)
+        self.recipe.name = 'Щи'
+        self.recipe.save()
+        self.assertEqual(list(Recipe.objects.search('щи')), [self.recipe])
+        self.assertFalse(Recipe.objects.search('борщ').exists())
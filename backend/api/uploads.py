@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер загружаемых данных превышает допустимый.'
+    default_code = 'request_too_large'
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Прерывает загрузку, как только объём файлов превысит лимит.
+
+    Стоит первым в FILE_UPLOAD_HANDLERS и передаёт данные дальше без
+    изменений, поэтому файл не успевает целиком оказаться на диске.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.received = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length and content_length > settings.UPLOAD_MAX_SIZE:
+            raise RequestTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            raise RequestTooLarge()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
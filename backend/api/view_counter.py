@@ -0,0 +1,89 @@
+import atexit
+import os
+from collections import Counter
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import DatabaseError, models
+from django.db.models import Case, F, Value, When
+
+from recipes.models import Recipe
+
+
+class BufferedCounter:
+    """Накапливает счётчики в памяти процесса и сбрасывает их пачкой.
+
+    Раз в interval секунд все накопленные значения записываются одним
+    UPDATE ... CASE с приращением F(), поэтому параллельные сбросы из
+    разных воркеров не теряют друг друга. Срок сброса проверяется по
+    окончании каждого запроса воркера, а не только при новом попадании.
+    При падении воркера теряются только попадания за последний интервал.
+    """
+
+    def __init__(self, model, field, interval):
+        self.model = model
+        self.field = field
+        self.interval = interval
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counts = Counter()
+        self._flushed_at = monotonic()
+
+    def hit(self, pk):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Буфер унаследован от родителя при fork: его сбросит родитель.
+                self._reset()
+            self._counts[pk] += 1
+
+    def flush(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = monotonic()
+        self._write(counts)
+
+    def flush_due(self):
+        """Сбрасывает буфер, если с прошлого сброса прошло interval."""
+        with self._lock:
+            if (
+                self._pid != os.getpid()
+                or not self._counts
+                or monotonic() - self._flushed_at < self.interval
+            ):
+                return
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = monotonic()
+        self._write(counts)
+
+    def _write(self, counts):
+        if not counts:
+            return
+        try:
+            self.model.objects.filter(pk__in=counts).update(
+                **{
+                    self.field: F(self.field)
+                    + Case(
+                        *(
+                            When(pk=pk, then=Value(count))
+                            for pk, count in counts.items()
+                        ),
+                        default=Value(0),
+                        output_field=models.IntegerField(),
+                    )
+                }
+            )
+        except DatabaseError:
+            with self._lock:
+                self._counts.update(counts)
+
+
+recipe_views = BufferedCounter(
+    Recipe, 'views_count', settings.VIEW_COUNTER_FLUSH_INTERVAL
+)
+atexit.register(recipe_views.flush)
@@ -1,20 +1,48 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    OuterRef,
+    Value,
+)
+from django.http import Http404
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import condition, require_GET
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
+from . import shopping_list, short_links
+from .cache import (
+    FAVORITES,
+    RECIPE_RESPONSES,
+    SHOPPING_CART,
+    SUBSCRIPTIONS,
+    anonymous_response_cache,
+    bump_generation,
+    generation_etag,
+    user_generation,
+)
+from .constants import INGREDIENT_SEARCH_LIMIT, SHOPPING_LIST_CHUNK_SIZE
+from .counters import change_counter
 from .filters import RecipeFilter
-from .pagination import PageLimitPaginator
+from .ingredient_index import ingredient_index
+from .pagination import (
+    FeedPaginator,
+    KeysetPaginationMixin,
+    PageLimitPaginator,
+)
 from .permissions import AuthorOrAdminOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
 from .serializers import (
     AvatarSerializer,
     CreateRecipeSerializer,
@@ -22,26 +50,38 @@ from .serializers import (
     FavoriteSerializer,
     FullRecipeSerializer,
     IngredientSerializer,
+    RecipeBatchSerializer,
     ShoppingCartSerializer,
     SubscriberCreateSerializer,
     SubscriberDetailSerializer,
     TagSerializer,
 )
+from .short_links import recipe_existence
+from .view_counter import recipe_views
 from recipes.models import (
+    FavoriteRecipe,
+    FeedEntry,
     Ingredient,
-    IngredientRecipe,
     Recipe,
+    ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(KeysetPaginationMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = [AllowAny]
     pagination_class = PageLimitPaginator
+    keyset_ordering = ('username', 'id')
+
+    def get_count_generations(self):
+        if self.action == 'subscriptions':
+            return (user_generation(SUBSCRIPTIONS, self.request.user.pk),)
+        return ()
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def me(self, request):
@@ -80,6 +120,9 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         queryset = User.objects.filter(author__subscriber=request.user)
         page = self.paginate_queryset(queryset)
+        SubscriberDetailSerializer.prefetch_recipes(
+            page, SubscriberDetailSerializer.get_recipes_limit(request)
+        )
         serializer = SubscriberDetailSerializer(
             page, many=True, context={'request': request}
         )
@@ -98,15 +141,23 @@ class CustomUserViewSet(UserViewSet):
             context={'request': request},
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            change_counter(User, [user_to_sub.id], 'subscribers_count', 1)
+            FeedEntry.objects.backfill(request.user.id, user_to_sub.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def remove_subscription(self, request, id=None):
         user_to_follow = get_object_or_404(User, id=id)
-        deleted_count, _ = request.user.subscriber.filter(
-            author=user_to_follow
-        ).delete()
+        with transaction.atomic():
+            deleted_count, _ = request.user.subscriber.filter(
+                author=user_to_follow
+            ).delete()
+            change_counter(
+                User, [user_to_follow.id], 'subscribers_count', -deleted_count
+            )
+            request.user.feed_entries.filter(author=user_to_follow).delete()
         if not deleted_count:
             return Response(
                 {'detail': 'Вы не подписаны на данного пользователя.'},
@@ -115,28 +166,113 @@ class CustomUserViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class ReferenceDataViewSet(viewsets.ReadOnlyModelViewSet):
+    """Справочник с ETag, зависящим от поколения модели.
+
+    Поколение меняется при любой записи в таблицу, поэтому на запрос с
+    актуальным If-None-Match ответ 304 отдаётся без обращения к ORM.
+    """
+
+    pagination_class = None
+
+    def dispatch(self, request, *args, **kwargs):
+        etag_func = generation_etag(self.queryset.model._meta.label_lower)
+        return condition(etag_func=etag_func)(super().dispatch)(
+            request, *args, **kwargs
+        )
+
+
+class IngredientViewSet(ReferenceDataViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    pagination_class = None
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(
+                ingredient_index.search(name, INGREDIENT_SEARCH_LIMIT)
+            )
+        return super().list(request, *args, **kwargs)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.select_related('author').prefetch_related(
-        'ingredients',
-        'tags',
-    )
+class RecipeViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.select_related('author')
     pagination_class = PageLimitPaginator
+    keyset_ordering = ('-created_at', '-id')
+    keyset_incompatible_params = ('search',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = [AuthorOrAdminOrReadOnly]
+    user_count_filters = {
+        'is_favorited': FAVORITES,
+        'is_in_shopping_cart': SHOPPING_CART,
+    }
+
+    def get_count_generations(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return ()
+        return tuple(
+            user_generation(name, user.pk)
+            for param, name in self.user_count_filters.items()
+            if param in self.request.query_params
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                FavoriteRecipe.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    @anonymous_response_cache(
+        RECIPE_RESPONSES,
+        (
+            'page',
+            'limit',
+            'tags',
+            'author',
+            'search',
+            'pagination',
+            'cursor',
+        ),
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.get_recipe_response(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            recipe_views.hit(response.data['id'])
+        return response
+
+    @anonymous_response_cache(RECIPE_RESPONSES, ())
+    def get_recipe_response(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            ShoppingListItem.objects.remove_recipes(
+                list(instance.in_shopping_cart.values_list('user', flat=True)),
+                [instance.pk],
+            )
+            instance.delete()
+            change_counter(User, [instance.author_id], 'recipes_count', -1)
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -168,10 +304,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return Response(read_serializer.data, status=status.HTTP_200_OK)
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала (курсор ?cursor=)."""
+        paginator = FeedPaginator()
+        if paginator.cursor_query_param not in request.query_params:
+            FeedEntry.objects.pull(request.user.id, settings.FEED_PULL_LIMIT)
+        entries = paginator.paginate_queryset(
+            request.user.feed_entries.all(), request
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = FullRecipeSerializer(
+            [recipes[entry.recipe_id] for entry in entries],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, url_path='get-link')
     def get_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        short_link = reverse('short_url', kwargs={'pk': recipe.pk})
+        if not pk.isascii() or not pk.isdigit():
+            raise Http404
+        pk = int(pk)
+        if not recipe_existence.exists(pk):
+            raise Http404
+        short_link = reverse(
+            'short_link', kwargs={'code': short_links.encode(pk)}
+        )
         return Response(
             {'short-link': request.build_absolute_uri(short_link)},
             status=status.HTTP_200_OK,
@@ -189,16 +350,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=data,
             context={'request': request},
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            self.lock_user_recipes(request.user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            ShoppingListItem.objects.add_recipes(
+                [request.user.id], [recipe.id]
+            )
+            change_counter(Recipe, [recipe.id], 'in_carts_count', 1)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def remove_shopping_cart(self, request, pk=None):
         recipe = get_object_or_404(Recipe, id=pk)
-        deleted_count, _ = request.user.user_shopping_cart.filter(
-            recipe=recipe
-        ).delete()
+        with transaction.atomic():
+            self.lock_user_recipes(request.user)
+            deleted_count, _ = request.user.user_shopping_cart.filter(
+                recipe=recipe
+            ).delete()
+            if deleted_count:
+                ShoppingListItem.objects.remove_recipes(
+                    [request.user.id], [recipe.id]
+                )
+                change_counter(Recipe, [recipe.id], 'in_carts_count', -1)
         if not deleted_count:
             return Response(
                 {'detail': 'Рецепт отсутствует в корзине пользователя.'},
@@ -209,32 +383,154 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_204_NO_CONTENT,
         )
 
+    @staticmethod
+    def lock_user_recipes(user):
+        """Блокирует строку пользователя до конца транзакции.
+
+        Все изменения избранного и корзины пользователя берут эту
+        блокировку, поэтому прочитанные до записи строки совпадают с
+        записанными, и счётчики меняются только для них.
+        """
+        list(
+            User.objects.select_for_update()
+            .filter(pk=user.pk)
+            .values_list('pk', flat=True)
+        )
+
+    def add_batch(self, request, model, counter_field):
+        """Добавляет рецепты пользователю одним INSERT.
+
+        Возвращает статус для каждого id и список добавленных рецептов.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        self.lock_user_recipes(request.user)
+        found = set(
+            Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                'pk', flat=True
+            )
+        )
+        present = set(
+            model.objects.filter(
+                user=request.user, recipe__in=found
+            ).values_list('recipe', flat=True)
+        )
+        added = [pk for pk in recipe_ids if pk in found - present]
+        if added:
+            model.objects.bulk_create(
+                [model(user=request.user, recipe_id=pk) for pk in added]
+            )
+            change_counter(Recipe, added, counter_field, 1)
+            name = user_generation(
+                FAVORITES if model is FavoriteRecipe else SHOPPING_CART,
+                request.user.pk,
+            )
+            transaction.on_commit(lambda: bump_generation(name))
+        results = [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else 'exists' if pk in present
+                    else 'added'
+                ),
+            }
+            for pk in recipe_ids
+        ]
+        return results, added
+
+    def remove_batch(self, request, model, counter_field):
+        """Удаляет рецепты пользователя одним DELETE ... IN."""
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        self.lock_user_recipes(request.user)
+        items = model.objects.filter(user=request.user, recipe__in=recipe_ids)
+        removed = list(items.values_list('recipe', flat=True))
+        if removed:
+            items.delete()
+            change_counter(Recipe, removed, counter_field, -1)
+        results = [
+            {
+                'id': pk,
+                'status': 'removed' if pk in removed else 'not_found',
+            }
+            for pk in recipe_ids
+        ]
+        return results, removed
+
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление списка рецептов в корзину: {"recipes": [id, ...]}."""
+        with transaction.atomic():
+            results, added = self.add_batch(
+                request, ShoppingCart, 'in_carts_count'
+            )
+            ShoppingListItem.objects.add_recipes([request.user.id], added)
+        return Response({'recipes': results}, status=status.HTTP_200_OK)
+
+    @shopping_cart_batch.mapping.delete
+    def remove_shopping_cart_batch(self, request):
+        with transaction.atomic():
+            results, removed = self.remove_batch(
+                request, ShoppingCart, 'in_carts_count'
+            )
+            ShoppingListItem.objects.remove_recipes(
+                [request.user.id], removed
+            )
+        return Response({'recipes': results}, status=status.HTTP_200_OK)
+
     @action(
         detail=False,
         methods=['GET'],
         permission_classes=[permissions.IsAuthenticated],
         url_path='download_shopping_cart',
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def download_shopping_cart(self, request):
-        """Список покупок"""
-        user = request.user
-        recipes_in_cart = user.user_shopping_cart.values_list(
-            'recipe', flat=True
-        )
-        ingredients = (
-            IngredientRecipe.objects.filter(recipe__in=recipes_in_cart)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
-        response_content = '\n'.join(
-            f'{item["ingredient__name"]}'
-            f'({item["ingredient__measurement_unit"]}) - '
-            f'{item["total_amount"]}'
-            for item in ingredients
+        """Список покупок в формате txt, csv или json (?format=)."""
+        export_format = request.accepted_renderer.format
+        recipe_ids = list(
+            request.user.user_shopping_cart.order_by('recipe').values_list(
+                'recipe', flat=True
+            )
         )
-        response = HttpResponse(response_content, content_type='text/plain')
+        cache_key = shopping_list.get_cache_key(recipe_ids, export_format)
+        content = cache.get(cache_key)
+        if content is not None:
+            response = HttpResponse(
+                content,
+                content_type=shopping_list.CONTENT_TYPES[export_format],
+            )
+        else:
+            rows = (
+                request.user.shopping_list_items.order_by(
+                    'ingredient__name', 'ingredient'
+                )
+                .values_list(
+                    'ingredient__name',
+                    'ingredient__measurement_unit',
+                    'total_amount',
+                )
+                .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+            )
+            response = StreamingHttpResponse(
+                shopping_list.stream_and_cache(
+                    rows,
+                    export_format,
+                    cache_key,
+                    settings.SHOPPING_LIST_CACHE_TIMEOUT,
+                ),
+                content_type=shopping_list.CONTENT_TYPES[export_format],
+            )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{export_format}"'
         )
         return response
 
@@ -251,17 +547,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=data,
             context={'request': request},
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            self.lock_user_recipes(request.user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            change_counter(Recipe, [recipe.id], 'favorites_count', 1)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
     def remove_favorite(self, request, pk=None):
         """Удаление рецепта из избранного"""
         recipe = get_object_or_404(Recipe, id=pk)
-        favorite_item_deleted, _ = request.user.user_favorite.filter(
-            recipe=recipe
-        ).delete()
+        with transaction.atomic():
+            self.lock_user_recipes(request.user)
+            favorite_item_deleted, _ = request.user.user_favorite.filter(
+                recipe=recipe
+            ).delete()
+            change_counter(
+                Recipe, [recipe.id], 'favorites_count', -favorite_item_deleted
+            )
 
         if not favorite_item_deleted:
             return Response(
@@ -273,9 +577,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_204_NO_CONTENT,
         )
 
+    @action(
+        methods=['POST'],
+        detail=False,
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        """Добавление списка рецептов в избранное."""
+        with transaction.atomic():
+            results, _ = self.add_batch(
+                request, FavoriteRecipe, 'favorites_count'
+            )
+        return Response({'recipes': results}, status=status.HTTP_200_OK)
+
+    @favorite_batch.mapping.delete
+    def remove_favorite_batch(self, request):
+        with transaction.atomic():
+            results, _ = self.remove_batch(
+                request, FavoriteRecipe, 'favorites_count'
+            )
+        return Response({'recipes': results}, status=status.HTTP_200_OK)
+
 
 @require_GET
-def short_url(request, pk):
-    if not Recipe.objects.filter(pk=pk).exists():
-        raise ValidationError(f'Рецепт {pk} не существует.')
+def short_url(request, pk=None, code=None):
+    if code is not None:
+        pk = short_links.decode(code)
+    if pk is None or not recipe_existence.exists(pk):
+        raise Http404(f'Рецепт {code or pk} не существует.')
+    recipe_views.hit(pk)
     return redirect(f'/recipes/{pk}/')
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -80,6 +81,29 @@ DATABASES = {
 }
 
 
+# Поколения кэша сбрасывают и веб-воркеры, и management-команды,
+# поэтому кэш должен быть общим для всех процессов. Каждое обращение к
+# поколению — это запрос к кэшу, так что нужен быстрый сетевой кэш:
+# memcached. Тесты работают с локальным кэшем процесса.
+TESTING = sys.argv[1:2] == ['test']
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.locmem.LocMemCache'
+    if TESTING
+    else 'django.core.cache.backends.memcached.PyMemcacheCache',
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    }
+}
+if CACHE_BACKEND == 'django.core.cache.backends.db.DatabaseCache':
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -144,6 +168,57 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'api.parsers.MultiPartJSONParser',
+        'rest_framework.parsers.FormParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 300)
+)
+PAGINATION_ESTIMATE_COUNT_THRESHOLD = (
+    int(os.getenv('PAGINATION_ESTIMATE_COUNT_THRESHOLD'))
+    if os.getenv('PAGINATION_ESTIMATE_COUNT_THRESHOLD')
+    else None
+)
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 3600))
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 3600)
+)
+
+IMAGE_THUMBNAIL_SIZE = (
+    int(os.getenv('IMAGE_THUMBNAIL_WIDTH', 480)),
+    int(os.getenv('IMAGE_THUMBNAIL_HEIGHT', 480)),
+)
+IMAGE_FULL_SIZE = (
+    int(os.getenv('IMAGE_FULL_WIDTH', 2048)),
+    int(os.getenv('IMAGE_FULL_HEIGHT', 2048)),
+)
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 300))
+
+VIEW_COUNTER_FLUSH_INTERVAL = int(
+    os.getenv('VIEW_COUNTER_FLUSH_INTERVAL', 10)
+)
+
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 256 * 1024)
+)
+FILE_UPLOAD_HANDLERS = [
+    'api.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+FEED_PULL_LIMIT = int(os.getenv('FEED_PULL_LIMIT', 500))
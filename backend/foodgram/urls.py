@@ -8,6 +8,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('s/<int:pk>', short_url, name='short_url'),
+    path('s/<str:code>', short_url, name='short_link'),
 ]
 
 if settings.DEBUG:
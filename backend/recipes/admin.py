@@ -1,6 +1,5 @@
 from django.contrib import admin
-from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import Group
 from users.models import Subscription
 
 from .models import (
@@ -9,30 +8,13 @@ from .models import (
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
 admin.site.unregister(Group)
 
 
-@admin.register(User)
-class UserAdmin(BaseUserAdmin):
-    list_display = (
-        'id',
-        'email',
-        'username',
-        'first_name',
-        'last_name',
-        'favorite_count',
-    )
-    search_fields = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
-
-    @admin.display(description='Кол-во добавлений в Избранное')
-    def favorite_count(self, obj):
-        return obj.favorite_set.count()
-
-
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('id', 'subscriber', 'author')
@@ -59,6 +41,12 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user', 'recipe')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    list_filter = ('user',)
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug')
@@ -81,7 +69,16 @@ class IngredientRecipeInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
-    list_display = ('id', 'author', 'name', 'image', 'text')
+    list_display = (
+        'id',
+        'author',
+        'name',
+        'image',
+        'text',
+        'favorites_count',
+        'in_carts_count',
+        'views_count',
+    )
     list_display_links = ('id', 'name')
     inlines = [
         IngredientRecipeInline,
@@ -0,0 +1,317 @@
+import io
+import random
+from array import array
+from multiprocessing import Pool
+from zlib import crc32
+
+from api.images import ensure_variants
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from PIL import Image
+from recipes.constants import MAX_AMOUNT, MAX_TIME, MIN_AMOUNT, MIN_TIME
+from recipes.management.commands.repair_counters import repair_counters
+from recipes.models import (
+    FavoriteRecipe,
+    FeedEntry,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+IMAGE_NAME = 'recipes/images/generated.png'
+
+STATE = {}
+
+
+def init_worker(state):
+    connections.close_all()
+    STATE.update(state)
+
+
+def zipf_index(size, exponent, rng):
+    """Индекс 0..size-1 с вероятностью, убывающей как 1 / rank ** exponent.
+
+    Используется обратная функция распределения непрерывного степенного
+    закона, поэтому выборка не требует памяти, пропорциональной size.
+    """
+    if exponent <= 0:
+        return rng.randrange(size)
+    uniform = rng.random()
+    if exponent == 1:
+        rank = size ** uniform
+    else:
+        power = 1 - exponent
+        rank = ((size ** power - 1) * uniform + 1) ** (1 / power)
+    return min(int(rank) - 1, size - 1)
+
+
+def create_users(start, count, seed):
+    prefix = STATE['prefix']
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=STATE['password'],
+            )
+            for number in range(start, start + count)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def create_recipes(start, count, seed):
+    rng = random.Random(seed)
+    user_ids = STATE['user_ids']
+    Recipe.objects.bulk_create(
+        [
+            Recipe(
+                author_id=user_ids[
+                    zipf_index(len(user_ids), STATE['zipf'], rng)
+                ],
+                name=f'Рецепт {number}',
+                text=f'Описание рецепта {number}',
+                image=IMAGE_NAME,
+                image_variants_ready=True,
+                cooking_time=rng.randint(MIN_TIME, min(MAX_TIME, 240)),
+            )
+            for number in range(start, start + count)
+        ]
+    )
+
+
+def create_recipe_links(start, count, seed):
+    rng = random.Random(seed)
+    ingredient_ids = STATE['ingredient_ids']
+    tag_ids = STATE['tag_ids']
+    mean = STATE['ingredients_per_recipe']
+    ingredients, tags = [], []
+    for recipe_id in STATE['recipe_ids'][start:start + count]:
+        size = max(1, int(rng.expovariate(1 / mean)))
+        size = min(size, len(ingredient_ids))
+        ingredients.extend(
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(MIN_AMOUNT, min(MAX_AMOUNT, 1000)),
+            )
+            for ingredient_id in rng.sample(ingredient_ids, size)
+        )
+        tags.extend(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        )
+    IngredientRecipe.objects.bulk_create(ingredients, ignore_conflicts=True)
+    Recipe.tags.through.objects.bulk_create(tags, ignore_conflicts=True)
+
+
+def create_user_recipe_links(model, count, seed):
+    rng = random.Random(seed)
+    user_ids = STATE['user_ids']
+    recipe_ids = STATE['recipe_ids']
+    model.objects.bulk_create(
+        [
+            model(
+                user_id=rng.choice(user_ids),
+                recipe_id=recipe_ids[
+                    zipf_index(len(recipe_ids), STATE['zipf'], rng)
+                ],
+            )
+            for _ in range(count)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def create_favorites(start, count, seed):
+    create_user_recipe_links(FavoriteRecipe, count, seed)
+
+
+def create_carts(start, count, seed):
+    create_user_recipe_links(ShoppingCart, count, seed)
+
+
+def create_subscriptions(start, count, seed):
+    rng = random.Random(seed)
+    user_ids = STATE['user_ids']
+    subscriptions = []
+    for _ in range(count):
+        subscriber = rng.choice(user_ids)
+        author = user_ids[zipf_index(len(user_ids), STATE['zipf'], rng)]
+        if subscriber != author:
+            subscriptions.append(
+                Subscription(subscriber_id=subscriber, author_id=author)
+            )
+    Subscription.objects.bulk_create(subscriptions, ignore_conflicts=True)
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического набора данных для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=2000,
+            help='Сколько ингредиентов создать, если справочник пуст',
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=8,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель закона Ципфа для популярности авторов и '
+            'рецептов; 0 — равномерное распределение',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Число процессов; на SQLite запись всё равно '
+            'выполняется последовательно',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='loadtest',
+            help='Префикс имён и email создаваемых пользователей',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--batch-size и --workers должны быть > 0')
+        self.options = options
+        self.state = {
+            'prefix': options['prefix'],
+            'password': make_password(None),
+            'zipf': options['zipf'],
+            'ingredients_per_recipe': options['ingredients_per_recipe'],
+        }
+        self.prepare_reference_data()
+
+        first_user = User.objects.filter(
+            username__startswith=options['prefix']
+        ).count()
+        self.run('Пользователи', create_users, options['users'], first_user)
+        self.state['user_ids'] = self.load_ids(User.objects.all())
+        if not self.state['user_ids']:
+            raise CommandError('Нет пользователей для генерации рецептов')
+
+        last_recipe = self.max_id(Recipe)
+        self.run(
+            'Рецепты', create_recipes, options['recipes'], last_recipe + 1
+        )
+        self.state['recipe_ids'] = self.load_ids(
+            Recipe.objects.filter(pk__gt=last_recipe)
+        )
+        self.run(
+            'Ингредиенты и теги рецептов',
+            create_recipe_links,
+            len(self.state['recipe_ids']),
+            batch_size=max(
+                1, options['batch_size'] // options['ingredients_per_recipe']
+            ),
+        )
+        self.state['recipe_ids'] = self.load_ids(Recipe.objects.all())
+        self.run('Избранное', create_favorites, options['favorites'])
+        self.run('Списки покупок', create_carts, options['carts'])
+        self.run('Подписки', create_subscriptions, options['subscriptions'])
+
+        self.stdout.write('Пересчёт счётчиков, списков покупок и лент...')
+        repair_counters()
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        FeedEntry.objects.rebuild()
+        Recipe.objects.filter(
+            search_vector__isnull=True
+        ).update_search_vector()
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS('Генерация завершена'))
+
+    def prepare_reference_data(self):
+        options = self.options
+        Tag.objects.bulk_create(
+            [
+                Tag(name=f'Тег {number}', slug=f'tag-{number}')
+                for number in range(options['tags'])
+            ],
+            ignore_conflicts=True,
+        )
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(
+                        name=f'ингредиент {number}', measurement_unit='г'
+                    )
+                    for number in range(options['ingredients'])
+                ]
+            )
+        self.state['tag_ids'] = list(Tag.objects.values_list('id', flat=True))
+        self.state['ingredient_ids'] = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        if not default_storage.exists(IMAGE_NAME):
+            image = io.BytesIO()
+            Image.new('RGB', (64, 64), (200, 120, 60)).save(image, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(image.getvalue()))
+        ensure_variants(Recipe(image=IMAGE_NAME).image)
+
+    @staticmethod
+    def max_id(model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+
+    @staticmethod
+    def load_ids(queryset):
+        return array(
+            'q',
+            queryset.order_by('pk').values_list('pk', flat=True).iterator(),
+        )
+
+    def run(self, title, function, total, start=0, batch_size=None):
+        batch_size = batch_size or self.options['batch_size']
+        seed = self.options['seed'] * 1_000_003 + crc32(
+            function.__name__.encode('ascii')
+        )
+        tasks = [
+            (start + offset, min(batch_size, total - offset), seed + offset)
+            for offset in range(0, total, batch_size)
+        ]
+        self.stdout.write(f'{title}: {total} в {len(tasks)} пакетах')
+        if self.options['workers'] == 1:
+            STATE.update(self.state)
+            for task in tasks:
+                function(*task)
+            return
+        connections.close_all()
+        with Pool(
+            self.options['workers'],
+            initializer=init_worker,
+            initargs=(self.state,),
+        ) as pool:
+            pool.starmap(function, tasks)
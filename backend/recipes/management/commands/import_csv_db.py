@@ -1,39 +1,165 @@
 import csv
+import io
+import json
+import sys
+from itertools import chain, islice
 
-from django.core.management.base import BaseCommand
+from api.cache import bump_generation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.constants import INGREDIENT_LENGTH, UNIT_LENGTH
 from recipes.models import Ingredient
 
 
+class RowStream(io.RawIOBase):
+    """Файловый объект, отдающий строки CSV по мере чтения (для COPY)."""
+
+    def __init__(self, rows):
+        self._lines = (
+            self._encode(name, measurement_unit)
+            for name, measurement_unit in rows
+        )
+        self._buffer = b''
+
+    @staticmethod
+    def _encode(name, measurement_unit):
+        line = io.StringIO()
+        csv.writer(line).writerow((name, measurement_unit))
+        return line.getvalue().encode('utf-8')
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
 class Command(BaseCommand):
-    help = 'Импорт данных из CSV файла'
+    help = 'Пакетный импорт ингредиентов из CSV или JSON'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--csv_file',
             type=str,
             default='data/ingredients.csv',
-            help='Путь к CSV файлу',
+            help='Путь к файлу с ингредиентами или "-" для stdin',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('auto', 'csv', 'json'),
+            default='auto',
+            help='Формат файла; auto определяет его по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY (только PostgreSQL)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['csv_file']
+        file_format = options['format']
+        if file_format == 'auto':
+            file_format = 'json' if path.endswith('.json') else 'csv'
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только в PostgreSQL')
+
+        self.rows_read = self.rows_invalid = 0
+        before = Ingredient.objects.count()
+        if path == '-':
+            self.load(sys.stdin, file_format, options)
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as file:
+                    self.load(file, file_format, options)
+            except OSError as error:
+                raise CommandError(f'Не удалось открыть {path}: {error}')
+        added = Ingredient.objects.count() - before
+        bump_generation(Ingredient._meta.label_lower)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Прочитано строк: {self.rows_read}, добавлено: {added}, '
+                'уже существовало: '
+                f'{self.rows_read - self.rows_invalid - added}, '
+                f'пропущено некорректных: {self.rows_invalid}'
+            )
         )
 
-    def handle(self, *args, **kwargs):
-        csv_file = kwargs['csv_file']
-        with open(csv_file, newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                name = row['name']
-                measurement_unit = row['measurement_unit']
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=name, measurement_unit=measurement_unit
-                )
-                if created:
-                    self.stdout.write(
-                        self.style.SUCCESS(f"""
-                                                         Ингредиент "{name}"
-                                                         успешно добавлен.""")
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.WARNING(f"""
-                                                         Ингредиент "{name}"
-                                                         уже существует.""")
-                    )
+    def load(self, file, file_format, options):
+        if file_format == 'json':
+            records = self.read_json(file)
+        else:
+            records = csv.DictReader(file)
+        rows = self.clean(records)
+        if options['copy']:
+            self.copy(rows)
+        else:
+            self.insert(rows, options['batch_size'])
+
+    @staticmethod
+    def read_json(file):
+        """Читает JSON-массив целиком или JSON Lines построчно."""
+        first_line = file.readline()
+        if first_line.lstrip().startswith('['):
+            yield from json.loads(first_line + file.read())
+            return
+        for line in chain([first_line], file):
+            if line.strip():
+                yield json.loads(line)
+
+    def clean(self, records):
+        for record in records:
+            self.rows_read += 1
+            name = (record.get('name') or '').strip()
+            measurement_unit = (record.get('measurement_unit') or '').strip()
+            if (
+                not name
+                or not measurement_unit
+                or len(name) > INGREDIENT_LENGTH
+                or len(measurement_unit) > UNIT_LENGTH
+            ):
+                self.rows_invalid += 1
+                continue
+            yield name, measurement_unit
+
+    def insert(self, rows, batch_size):
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            self.stdout.write(f'Обработано строк: {self.rows_read}')
+
+    def copy(self, rows):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                RowStream(rows),
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import ON CONFLICT DO NOTHING'
+            )
@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Сверка списков покупок с содержимым корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            nargs='*',
+            help='id пользователей для сверки (по умолчанию все)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество пользователей, сверяемых за один проход',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user']
+        if not user_ids:
+            user_ids = sorted(
+                set(
+                    ShoppingCart.objects.values_list('user', flat=True)
+                ).union(
+                    ShoppingListItem.objects.values_list('user', flat=True)
+                )
+            )
+        batch_size = options['batch_size']
+        fixed = 0
+        for start in range(0, len(user_ids), batch_size):
+            fixed += self.reconcile(user_ids[start:start + batch_size])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Проверено пользователей: {len(user_ids)}, '
+                f'исправлено позиций: {fixed}'
+            )
+        )
+
+    @staticmethod
+    def reconcile(user_ids):
+        expected = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in (
+                IngredientRecipe.objects.filter(
+                    recipe__in_shopping_cart__user__in=user_ids
+                )
+                .values('recipe__in_shopping_cart__user', 'ingredient')
+                .annotate(total_amount=Sum('amount'))
+                .order_by()
+                .values_list(
+                    'recipe__in_shopping_cart__user',
+                    'ingredient',
+                    'total_amount',
+                )
+            )
+        }
+        with transaction.atomic():
+            actual = {
+                (item.user_id, item.ingredient_id): item
+                for item in ShoppingListItem.objects.select_for_update()
+                .filter(user__in=user_ids)
+            }
+            stale = [
+                item.pk
+                for key, item in actual.items()
+                if key not in expected
+            ]
+            changed = []
+            for key, total_amount in expected.items():
+                item = actual.get(key)
+                if item is not None and item.total_amount != total_amount:
+                    item.total_amount = total_amount
+                    changed.append(item)
+            missing = [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total_amount,
+                )
+                for (user_id, ingredient_id), total_amount in expected.items()
+                if (user_id, ingredient_id) not in actual
+            ]
+            ShoppingListItem.objects.filter(pk__in=stale).delete()
+            ShoppingListItem.objects.bulk_update(changed, ['total_amount'])
+            ShoppingListItem.objects.bulk_create(missing)
+        return len(stale) + len(changed) + len(missing)
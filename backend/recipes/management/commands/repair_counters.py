@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def repair_counters():
+    """Пересчитывает сохранённые счётчики рецептов и пользователей."""
+    with transaction.atomic():
+        recipes = Recipe.objects.update(
+            favorites_count=count_subquery(FavoriteRecipe, 'recipe'),
+            in_carts_count=count_subquery(ShoppingCart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            subscribers_count=count_subquery(Subscription, 'author'),
+        )
+    return recipes, users
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, корзин, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        recipes, users = repair_counters()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Пересчитано рецептов: {recipes}, пользователей: {users}'
+            )
+        )
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.3 on 2026-10-17 04:05
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_rows(model, owner, amount_field, keep, duplicates):
+    """Переносит строки на оставшийся ингредиент, складывая количества."""
+    rows = model.objects.filter(
+        ingredient__in=[keep, *duplicates]
+    ).order_by(owner, 'pk')
+    for _, group in groupby(rows, key=lambda row: getattr(row, f'{owner}_id')):
+        group = list(group)
+        target = next(
+            (row for row in group if row.ingredient_id == keep), group[0]
+        )
+        model.objects.filter(
+            pk__in=[row.pk for row in group if row.pk != target.pk]
+        ).delete()
+        changes = {'ingredient_id': keep}
+        if amount_field is not None:
+            changes[amount_field] = sum(
+                getattr(row, amount_field) for row in group
+            )
+        model.objects.filter(pk=target.pk).update(**changes)
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = (
+        Ingredient.objects.order_by()
+        .values('name', 'measurement_unit')
+        .annotate(keep=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        duplicates = list(
+            Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit'],
+            )
+            .exclude(pk=group['keep'])
+            .values_list('pk', flat=True)
+        )
+        merge_rows(
+            IngredientRecipe, 'recipe', 'amount', group['keep'], duplicates
+        )
+        merge_rows(
+            Recipe.ingredients.through,
+            'recipe',
+            None,
+            group['keep'],
+            duplicates,
+        )
+        merge_rows(
+            ShoppingListItem,
+            'user',
+            'total_amount',
+            group['keep'],
+            duplicates,
+        )
+        Ingredient.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
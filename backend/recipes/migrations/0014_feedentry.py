@@ -0,0 +1,76 @@
+# Generated by Django 3.2.3 on 2026-10-17 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    """Раскладывает рецепты по лентам, как FeedEntryManager.rebuild."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Subscription = apps.get_model('users', 'Subscription')
+    recipes = (
+        Recipe.objects.filter(
+            author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+        )
+        .annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('created_at').desc(), F('id').desc()),
+            )
+        )
+        .order_by()
+        .values('id', 'author_id', 'created_at', 'recipe_rank')
+    )
+    sql, params = recipes.query.sql_with_params()
+    schema_editor.execute(
+        f'INSERT INTO {FeedEntry._meta.db_table} '
+        '(subscriber_id, author_id, recipe_id, created_at) '
+        'SELECT subscription.subscriber_id, recipe.author_id, '
+        'recipe.id, recipe.created_at '
+        f'FROM ({sql}) recipe '
+        f'JOIN {Subscription._meta.db_table} subscription '
+        'ON subscription.author_id = recipe.author_id '
+        'WHERE recipe.recipe_rank <= %s',
+        (*params, settings.FEED_PULL_LIMIT),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_recipe_views_count'),
+        ('users', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'ordering': ('-created_at', '-recipe'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['subscriber', '-created_at', '-recipe'], name='feed_subscriber_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('subscriber', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
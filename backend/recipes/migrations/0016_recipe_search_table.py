@@ -0,0 +1,40 @@
+from importlib import import_module
+
+from django.db import migrations
+
+SEARCH = import_module('recipes.migrations.0015_recipe_search')
+
+# Самостоятельная таблица FTS5 хранит копию названия и описания, поэтому
+# её строки обновляются без старых значений и без триггеров, которые
+# SQLite удаляет при пересоздании recipes_recipe.
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    "name, text, tokenize='unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'SELECT id, name, text FROM recipes_recipe',
+)
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in (*SEARCH.SQLITE_DROP, *SQLITE_CREATE):
+        schema_editor.execute(statement)
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in (*SEARCH.SQLITE_DROP, *SEARCH.SQLITE_CREATE):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, restore_search_triggers),
+    ]
@@ -1,6 +1,31 @@
+import re
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
+from django.core.exceptions import EmptyResultSet
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, RowNumber
 
 from .constants import (
     INGREDIENT_LENGTH,
@@ -12,6 +37,7 @@ from .constants import (
     TAG_SLUG_LENGTH,
     UNIT_LENGTH,
 )
+from users.models import Subscription
 
 User = get_user_model()
 
@@ -26,6 +52,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name} {self.measurement_unit}'
@@ -46,6 +78,91 @@ class Tag(models.Model):
         return self.name
 
 
+SEARCH_CONFIG = 'russian'
+SQLITE_SEARCH_TABLE = 'recipes_recipe_fts'
+
+
+class RecipeQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        """Пересчитывает поисковый индекс рецептов.
+
+        В PostgreSQL это взвешенный tsvector, в SQLite — строки таблицы
+        FTS5. Индекс обновляется здесь, а не триггерами: SQLite теряет
+        их при пересоздании таблицы recipes_recipe в миграциях.
+        """
+        vendor = connections[self.db].vendor
+        if vendor == 'postgresql':
+            return self.update(
+                search_vector=SearchVector(
+                    'name', weight='A', config=SEARCH_CONFIG
+                )
+                + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            )
+        if vendor != 'sqlite':
+            return 0
+        try:
+            sql, params = self.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_SEARCH_TABLE} WHERE rowid IN ({sql})',
+                params,
+            )
+            cursor.execute(
+                f'INSERT INTO {SQLITE_SEARCH_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {self.model._meta.db_table} '
+                f'WHERE id IN ({sql})',
+                params,
+            )
+            return cursor.rowcount
+
+    def delete_search_entries(self, pks):
+        """Удаляет рецепты из таблицы FTS5 SQLite.
+
+        В PostgreSQL вектор хранится в самой строке рецепта.
+        """
+        if connections[self.db].vendor != 'sqlite':
+            return
+        with connections[self.db].cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SQLITE_SEARCH_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in pks],
+            )
+
+    def search(self, query):
+        """Полнотекстовый поиск по названию и описанию с ранжированием."""
+        vendor = connections[self.db].vendor
+        if vendor == 'postgresql':
+            search_query = SearchQuery(
+                query, config=SEARCH_CONFIG, search_type='websearch'
+            )
+            ranked = self.filter(search_vector=search_query).annotate(
+                search_rank=SearchRank(F('search_vector'), search_query)
+            )
+        elif vendor == 'sqlite':
+            terms = re.findall(r'\w+', query)
+            if not terms:
+                return self.none()
+            # Префиксный поиск заменяет стемминг, которого нет в FTS5.
+            match = ' '.join(f'"{term}"*' for term in terms)
+            ranked = self.annotate(
+                search_rank=RawSQL(
+                    f'SELECT -bm25({SQLITE_SEARCH_TABLE}, 10.0, 1.0) '
+                    f'FROM {SQLITE_SEARCH_TABLE} '
+                    f'WHERE {SQLITE_SEARCH_TABLE} MATCH %s '
+                    f'AND {SQLITE_SEARCH_TABLE}.rowid = '
+                    f'{self.model._meta.db_table}.id',
+                    (match,),
+                )
+            ).filter(search_rank__isnull=False)
+        else:
+            return self.filter(
+                Q(name__icontains=query) | Q(text__icontains=query)
+            )
+        return ranked.order_by('-search_rank', '-created_at', '-id')
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(Tag, verbose_name='Теги')
     ingredients = models.ManyToManyField(
@@ -72,15 +189,63 @@ class Recipe(models.Model):
         validators=[MinValueValidator(MIN_TIME), MaxValueValidator(MAX_TIME)],
     )
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок', default=0, editable=False
+    )
+    views_count = models.PositiveIntegerField(
+        'Просмотров', default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    image_variants_ready = models.BooleanField(
+        'Варианты изображения созданы', default=False, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=('-created_at', '-id'),
+                name='recipe_created_at_id_idx',
+            ),
+            GinIndex(
+                fields=('search_vector',), name='recipe_search_vector_idx'
+            ),
+        ]
+
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count', 'views_count')
+    SEARCH_FIELDS = ('name', 'text')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # Счётчики меняются только приращениями F(), а поисковый вектор
+        # считается в базе; полное сохранение существующего рецепта не
+        # должно затирать их устаревшими значениями.
+        if not self._state.adding and update_fields is None:
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.name != 'search_vector'
+            ]
+        super().save(*args, **kwargs)
+        if update_fields is None or set(update_fields) & set(
+            self.SEARCH_FIELDS
+        ):
+            type(self).objects.using(self._state.db).filter(
+                pk=self.pk
+            ).update_search_vector()
+
 
 class IngredientRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -175,3 +340,279 @@ class FavoriteRecipe(models.Model):
 
     def __str__(self):
         return f'Рецепт - {self.recipe.name}, добавлен в избранное'
+
+
+class ShoppingListItemManager(models.Manager):
+    @staticmethod
+    def get_recipe_amounts(recipe_ids):
+        """Суммирует количества ингредиентов в указанных рецептах."""
+        amounts = Counter()
+        for ingredient_id, amount in IngredientRecipe.objects.filter(
+            recipe__in=recipe_ids
+        ).values_list('ingredient', 'amount'):
+            amounts[ingredient_id] += amount
+        return amounts
+
+    def apply(self, user_ids, amounts):
+        """Прибавляет к спискам покупок пользователей изменения количеств.
+
+        amounts сопоставляет id ингредиента и изменение количества, которое
+        может быть отрицательным. Позиции с нулевым итогом удаляются.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if amount
+        }
+        if not user_ids or not amounts:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=0,
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, amount in amounts.items()
+                    if amount > 0
+                ],
+                ignore_conflicts=True,
+            )
+            self.filter(user__in=user_ids, ingredient__in=amounts).update(
+                total_amount=Greatest(
+                    F('total_amount')
+                    + Case(
+                        *(
+                            When(ingredient=ingredient_id, then=Value(amount))
+                            for ingredient_id, amount in amounts.items()
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                    0,
+                )
+            )
+            self.filter(
+                user__in=user_ids, ingredient__in=amounts, total_amount=0
+            ).delete()
+
+    def add_recipes(self, user_ids, recipe_ids):
+        self.apply(user_ids, self.get_recipe_amounts(recipe_ids))
+
+    def remove_recipes(self, user_ids, recipe_ids):
+        amounts = self.get_recipe_amounts(recipe_ids)
+        self.apply(user_ids, {key: -value for key, value in amounts.items()})
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+    )
+    total_amount = models.PositiveIntegerField('Количество', default=0)
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        ordering = ('user',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount}'
+
+
+class FeedEntryManager(models.Manager):
+    batch_size = 1000
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора.
+
+        Для авторов с подписчиками больше FEED_FANOUT_LIMIT записи не
+        создаются: читатели подтягивают их рецепты сами (см. pull).
+        """
+        if recipe.author.subscribers_count > settings.FEED_FANOUT_LIMIT:
+            return
+        subscribers = (
+            Subscription.objects.filter(author=recipe.author_id)
+            .values_list('subscriber', flat=True)
+            .iterator()
+        )
+        self._insert(
+            self.model(
+                subscriber_id=subscriber_id,
+                author_id=recipe.author_id,
+                recipe_id=recipe.pk,
+                created_at=recipe.created_at,
+            )
+            for subscriber_id in subscribers
+        )
+
+    def backfill(self, subscriber_id, author_id):
+        """Добавляет в ленту подписчика последние рецепты автора.
+
+        Берётся не больше FEED_PULL_LIMIT рецептов; авторов, чьи рецепты
+        не раскладываются по лентам (см. fan_out), пропускаем.
+        """
+        recipes = (
+            Recipe.objects.filter(
+                author=author_id,
+                author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+            )
+            .order_by('-created_at', '-id')
+            .values_list('pk', 'created_at')[: settings.FEED_PULL_LIMIT]
+        )
+        self._insert(
+            self.model(
+                subscriber_id=subscriber_id,
+                author_id=author_id,
+                recipe_id=recipe_id,
+                created_at=created_at,
+            )
+            for recipe_id, created_at in recipes.iterator()
+        )
+
+    def pull(self, subscriber_id, limit):
+        """Подтягивает в ленту рецепты популярных авторов при чтении.
+
+        Берутся последние limit рецептов: повторное чтение не дописывает
+        в ленту всё более старые рецепты.
+        """
+        latest = (
+            Recipe.objects.filter(
+                author__in=Subscription.objects.filter(
+                    subscriber=subscriber_id,
+                    author__subscribers_count__gt=settings.FEED_FANOUT_LIMIT,
+                ).values('author')
+            )
+            .order_by('-created_at', '-id')
+            .values('pk')[:limit]
+        )
+        recipes = (
+            Recipe.objects.filter(pk__in=latest)
+            .exclude(
+                Exists(
+                    self.filter(
+                        subscriber=subscriber_id, recipe=OuterRef('pk')
+                    )
+                )
+            )
+            .values_list('pk', 'author', 'created_at')
+        )
+        self._insert(
+            self.model(
+                subscriber_id=subscriber_id,
+                author_id=author_id,
+                recipe_id=recipe_id,
+                created_at=created_at,
+            )
+            for recipe_id, author_id, created_at in recipes
+        )
+
+    def rebuild(self):
+        """Заполняет ленты заново по текущим подпискам.
+
+        Как и при подписке, каждая подписка получает последние
+        FEED_PULL_LIMIT рецептов автора, а авторы с подписчиками больше
+        FEED_FANOUT_LIMIT пропускаются. Записи вставляются одним
+        INSERT ... SELECT без передачи строк через Python.
+        """
+        recipes = (
+            Recipe.objects.filter(
+                author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+            )
+            .annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('created_at').desc(), F('id').desc()),
+                )
+            )
+            .order_by()
+            .values('id', 'author_id', 'created_at', 'recipe_rank')
+        )
+        sql, params = recipes.query.sql_with_params()
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} '
+                    '(subscriber_id, author_id, recipe_id, created_at) '
+                    'SELECT subscription.subscriber_id, recipe.author_id, '
+                    'recipe.id, recipe.created_at '
+                    f'FROM ({sql}) recipe '
+                    f'JOIN {Subscription._meta.db_table} subscription '
+                    'ON subscription.author_id = recipe.author_id '
+                    'WHERE recipe.recipe_rank <= %s',
+                    (*params, settings.FEED_PULL_LIMIT),
+                )
+
+    def _insert(self, entries):
+        while True:
+            batch = list(islice(entries, self.batch_size))
+            if not batch:
+                break
+            self.bulk_create(batch, ignore_conflicts=True)
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, заранее разложенный по подпискам."""
+
+    subscriber = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    created_at = models.DateTimeField('Дата создания рецепта')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        ordering = ('-created_at', '-recipe')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscriber', 'recipe'],
+                name='unique_feed_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('subscriber', '-created_at', '-recipe'),
+                name='feed_subscriber_created_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.subscriber} - {self.recipe}'
@@ -3,5 +3,14 @@ from django.contrib.auth.admin import UserAdmin
 
 from .models import CustomUser
 
-UserAdmin.fieldsets += ()
-admin.site.register(CustomUser, UserAdmin)
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    list_display = UserAdmin.list_display + (
+        'recipes_count',
+        'subscribers_count',
+    )
+    fieldsets = UserAdmin.fieldsets + (
+        ('Статистика', {'fields': ('recipes_count', 'subscribers_count')}),
+    )
+    readonly_fields = ('recipes_count', 'subscribers_count')
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_variants_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Варианты аватара созданы'),
+        ),
+    ]
@@ -36,6 +36,17 @@ class CustomUser(AbstractUser):
         upload_to='media/avatars/',
         verbose_name='Аватар',
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False
+    )
+    avatar_variants_ready = models.BooleanField(
+        'Варианты аватара созданы', default=False, editable=False
+    )
+
+    COUNTER_FIELDS = ('recipes_count', 'subscribers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = (
@@ -53,6 +64,18 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Счётчики меняются только атомарными UPDATE: полное сохранение
+        # загруженного ранее пользователя не должно их перезаписывать.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class Subscription(models.Model):
     author = models.ForeignKey(